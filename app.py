@@ -1,18 +1,21 @@
 import pygubu
 import tkinter as tk
 from tkinter import filedialog
-import csv
 import logging
-from avl_tree import AvlTree, AvlTreeNode
-from binary_tree import BinaryTree, TreeNode
-from bin_heap import BinaryMinHeap
+import tracing
+from engines import SEARCH_TREES, create_engine
+from ingest import delete_file, insert_file, read_batches
+from datagen import write_keys
 from argparse import ArgumentParser
 import time
-from random import randint
+import io
 import tkinter.simpledialog
 
 logger = logging.getLogger()
 
+# Larger trees are cut off when shown, the text widget can't take millions of lines
+MAX_SHOWN_NODES = 10000
+
 
 class Application(pygubu.TkApplication):
     def __init__(self, master):
@@ -26,6 +29,8 @@ class Application(pygubu.TkApplication):
         builder.connect_callbacks(self)
         self.trees = {}
         self.trace_mode = False
+        # Count comparisons, rotations and swaps of every tree, see counters.py
+        self.count_operations = False
         self.selected_tree = None
 
         self.status_text = builder.get_object("statustext")
@@ -126,21 +131,19 @@ class Application(pygubu.TkApplication):
                 "There is already a tree with name: {0}".format(name))
         except KeyError:
             logger.info("Created new Tree of type {} linked".format(type))
-            if "heap" == type:
-                self.trees[name] = BinaryMinHeap(name)
-            else:
-                self.trees[name] = AvlTree(name)
+            self.trees[name] = create_engine(type, name)
+            if self.count_operations:
+                try:
+                    self.trees[name].enable_stats()
+                except ValueError as e:
+                    logger.warning(str(e))
             return
         raise ValueError
 
     def get_type(self, tree):
-        dummyType = AvlTree("dummy")
-        logger.debug("Type of tree: {}, {}".format(
-            type(tree), type(dummyType)))
-        if type(tree) == type(dummyType):
-            del dummyType
+        logger.debug("Type of tree: {}".format(type(tree)))
+        if isinstance(tree, SEARCH_TREES):
             return "(AVL Tree)"
-        del dummyType
         return "(Binary Heap)"
 
     def ListNames(self):
@@ -199,15 +202,25 @@ class Application(pygubu.TkApplication):
             return
         result = int(result)
 
+        self.selected_tree.reset_stats()
         t1 = time.perf_counter()
         self.selected_tree.insert(result)
         t2 = time.perf_counter()
         self.setLabels()
         self.appendMessage(
             "Item {} inserted in {} seconds".format(result, (t2 - t1)))
+        self.appendStats()
         if self.trace_mode:
             self.appendMessage("{}".format(self.selected_tree))
 
+    # Operation counts of the last operation on the selected tree, if it
+    # counts them
+    def appendStats(self):
+        if self.selected_tree.stats_enabled():
+            self.appendMessage("Operation counts: {}".format(
+                ", ".join("{} {}".format(name, count) for name, count in
+                          sorted(self.selected_tree.stats().items()) if count)))
+
     def GetTree(self):
         if not self.selected_tree:
             self.appendMessage("You need to select a tree first")
@@ -215,7 +228,13 @@ class Application(pygubu.TkApplication):
 
         self.appendMessage(
             "Pretty Print Tree {}".format(self.selected_tree.name))
-        self.appendMessage(str(self.selected_tree))
+        buffer = io.StringIO()
+        shown, truncated = self.selected_tree.dump(
+            buffer, max_nodes=MAX_SHOWN_NODES)
+        self.appendMessage(buffer.getvalue())
+        if truncated:
+            self.appendMessage(
+                "Only the first {} nodes are shown".format(shown))
 
     def CreateData(self):
         dialog = self.builder.get_object('createdatadiag')
@@ -231,42 +250,32 @@ class Application(pygubu.TkApplication):
         if not filename:
             self.appendMessage("No values read")
             return
-        elif ".csv" not in filename:
-            self.appendMessage("Only CSV files are allowed")
+        elif not filename.endswith(('.csv', '.bin')):
+            self.appendMessage("Only CSV and binary key files are allowed")
             return
 
-        f = open(filename, "r")
-        reader = csv.reader(f, delimiter=",")
-        keys = []
-
         logger.info("Reading all integers from file {0}".format(filename))
-        for key in reader:
-            keys.append(key)
-
-        if not keys or len(keys) <= 0:
-            self.appendMessage("No Keys found in the file")
-            return
-
-        keys = keys[0]
-
-        logger.info("Found {0} keys in file {1}".format(len(keys), filename))
-        logger.debug("Keys: {}".format(keys))
-
-        t1 = time.perf_counter()
-        for key in keys:
-            try:
-                key = int(key)
-                self.selected_tree.insert(int(key))
-                if self.trace_mode:
+        if self.trace_mode:
+            for keys in read_batches(filename):
+                for key in keys:
+                    self.selected_tree.insert(key)
                     self.appendMessage(
                         "Inserted Key {}, the tree is now {}".format(key, self.selected_tree))
-            except:
-                logger.error(
-                    "Found invalid key {} in file, skipping it".format(key))
+            self.setLabels()
+            return
+
+        # The file is read in chunks, an empty tree is built from all of them at
+        # once instead of inserted into one key at a time
+        report = insert_file(self.selected_tree, filename)
         self.setLabels()
-        t2 = time.perf_counter()
+        if not report.keys:
+            self.appendMessage("No Keys found in the file")
         self.appendMessage(
-            "Total time to insert {} keys: {} seconds".format(len(keys), (t2 - t1)))
+            "Total time to insert {} keys: {} seconds, {:.0f} keys per second".format(
+                report.keys, report.seconds, report.throughput()))
+        if report.rejected:
+            self.appendMessage(
+                "Skipped {} invalid keys".format(report.rejected))
 
     def SetTrace(self):
         self.trace_mode = self.builder.get_variable('set_trace').get()
@@ -276,6 +285,8 @@ class Application(pygubu.TkApplication):
         logger.info("Creating Data File")
         filename = self.builder.get_variable('create_data_filename').get()
         numKeys = self.builder.get_variable('num_keys_val').get()
+        distribution = self.builder.get_variable(
+            'create_data_distribution').get() or 'uniform'
 
         if not filename:
             self.appendMessage("Invalid Filename specified")
@@ -286,21 +297,14 @@ class Application(pygubu.TkApplication):
             return
 
         try:
-            f = open(filename, "w", newline="")
-            writer = csv.writer(f, delimiter=",")
-
             logger.info("Creating {0} keys in file {1}".format(
                 numKeys, filename))
-            keys = []
-            i = 0
-            while i < numKeys:
-                keys.append(randint(1000000000, 9999999999))
-                #keys.append(randint(-1000, 999))
-                i += 1
-
-            writer.writerow(keys)
+            t1 = time.perf_counter()
+            write_keys(filename, numKeys, distribution)
+            t2 = time.perf_counter()
             self.appendMessage(
-                "Wrote {} keys to file {}".format(numKeys, filename))
+                "Wrote {} {} keys to file {} in {} seconds".format(
+                    numKeys, distribution, filename, (t2 - t1)))
         except Exception as ex:
             self.appendMessage(
                 "An Exception has occurred while creating the data file: {}".format(ex))
@@ -321,12 +325,14 @@ class Application(pygubu.TkApplication):
             return
         result = int(result)
 
+        self.selected_tree.reset_stats()
         t1 = time.perf_counter()
         try:
             self.selected_tree.delete(result)
             t2 = time.perf_counter()
             self.appendMessage("Deleted item {} from Tree {} in {} seconds".format(
                 result, self.selected_tree.name, (t2 - t1)))
+            self.appendStats()
             if self.trace_mode:
                 self.appendMessage("{}".format(self.selected_tree))
             self.setLabels()
@@ -368,45 +374,37 @@ class Application(pygubu.TkApplication):
         if not filename:
             self.appendMessage("No values read")
             return
-        elif ".csv" not in filename:
-            self.appendMessage("Only CSV files are allowed")
+        elif not filename.endswith(('.csv', '.bin')):
+            self.appendMessage("Only CSV and binary key files are allowed")
             return
 
-        f = open(filename, "r")
-        reader = csv.reader(f, delimiter=",")
-        keys = []
-
         logger.info("Reading all integers from file {0}".format(filename))
-        for key in reader:
-            keys.append(key)
-
-        if not keys or len(keys) <= 0:
-            self.appendMessage("No Keys found in the file")
+        if self.trace_mode:
+            for keys in read_batches(filename):
+                for key in keys:
+                    try:
+                        self.selected_tree.delete(key)
+                        self.appendMessage(
+                            "Deleted Key {}, the Tree is now\n{}".format(key, self.selected_tree))
+                    except ValueError:
+                        self.appendMessage(
+                            "Key {} was not found in the tree".format(key))
+            self.setLabels()
             return
 
-        keys = keys[0]
-
-        logger.info("Found {0} keys in file {1}".format(len(keys), filename))
-        logger.debug("Keys: {}".format(keys))
-
-        t1 = time.perf_counter()
-        for key in keys:
-            try:
-                key = int(key)
-                self.selected_tree.delete(int(key))
-                if self.trace_mode:
-                    self.appendMessage(
-                        "Deleted Key {}, the Tree is now\n{}".format(key, self.selected_tree))
-            except ValueError:
-                self.appendMessage(
-                    "Key {} was not found in the tree".format(key))
-            except:
-                logger.error(
-                    "Found invalid key {} in file, skipping it".format(key))
+        report = delete_file(self.selected_tree, filename)
         self.setLabels()
-        t2 = time.perf_counter()
+        if not report.keys:
+            self.appendMessage("No Keys found in the file")
         self.appendMessage(
-            "Total time to delete {} keys: {} seconds".format(len(keys), (t2 - t1)))
+            "Deleted {} keys, {} keys were not found in the tree".format(
+                report.deleted, report.missing))
+        self.appendMessage(
+            "Total time to delete {} keys: {} seconds, {:.0f} keys per second".format(
+                report.keys, report.seconds, report.throughput()))
+        if report.rejected:
+            self.appendMessage(
+                "Skipped {} invalid keys".format(report.rejected))
 
     def FindMin(self):
         t1 = time.perf_counter()
@@ -438,6 +436,8 @@ if __name__ == '__main__':
     parser = ArgumentParser()
     logLevel = "DEBUG"
     parser.add_argument('--log')
+    parser.add_argument('--stats', action='store_true',
+                        help='count comparisons, rotations and swaps')
     args = parser.parse_args()
     logLevel = args.log
 
@@ -445,7 +445,9 @@ if __name__ == '__main__':
         numLogLevel = getattr(logging, logLevel.upper())
         logging.basicConfig(level=numLogLevel)
         logger.setLevel(numLogLevel)
+        tracing.set_trace(numLogLevel <= logging.DEBUG)
 
     root = tk.Tk()
     app = Application(root)
+    app.count_operations = args.stats
     app.run()
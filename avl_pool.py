@@ -0,0 +1,290 @@
+from binary_tree import TreeNode, BinaryTree
+import logging
+import tracing
+from argparse import ArgumentParser
+from array import array
+import random
+
+log = logging.getLogger()
+
+
+# AVL tree without node objects. Every node is a slot index into parallel typed
+# arrays holding the key, the children, the parent and the subtree height.
+# Slot 0 is the nil node, its height is 0 so it needs no special casing, and
+# freed slots are chained through the left array and reused by later inserts.
+# A key costs 21 bytes (8 + 3 * 4 + 1) plus the array growth slack
+class PooledAvlTree(BinaryTree):
+    complexity = {'insert': 'log n', 'find-hit': 'log n', 'find-miss': 'log n',
+                  'delete': 'log n', 'delete-min': 'log n',
+                  'bulk-load': 'log n', 'height': '1'}
+
+    def __init__(self, name):
+        BinaryTree.__init__(self, name)
+        self.root = 0
+        self.free = 0
+        self.keys = array('q', [0])
+        self.left = array('i', [0])
+        self.right = array('i', [0])
+        self.parent = array('i', [0])
+        self.heights = array('b', [0])
+
+    def height(self):
+        return self.heights[self.root]
+
+    def _delete_nodes(self, node):
+        # Nothing to unlink, the arrays go away with the tree
+        pass
+
+    def _alloc(self, value, parent):
+        node = self.free
+        if node:
+            self.free = self.left[node]
+            self.keys[node] = value
+            self.left[node] = 0
+            self.right[node] = 0
+            self.parent[node] = parent
+            self.heights[node] = 1
+            return node
+        self.keys.append(value)
+        self.left.append(0)
+        self.right.append(0)
+        self.parent.append(parent)
+        self.heights.append(1)
+        return len(self.keys) - 1
+
+    def _release(self, node):
+        self.keys[node] = 0
+        self.right[node] = 0
+        self.parent[node] = 0
+        self.heights[node] = 0
+        self.left[node] = self.free
+        self.free = node
+
+    def _update_height(self, node):
+        heights = self.heights
+        left = heights[self.left[node]]
+        right = heights[self.right[node]]
+        heights[node] = 1 + (left if left > right else right)
+
+    def _rotate_with_left_child(self, k2):
+        left, right, parent = self.left, self.right, self.parent
+        k1 = left[k2]
+        middle = right[k1]
+        left[k2] = middle
+        if middle:
+            parent[middle] = k2
+        right[k1] = k2
+        parent[k1] = parent[k2]
+        parent[k2] = k1
+        self._update_height(k2)
+        self._update_height(k1)
+        return k1
+
+    def _rotate_with_right_child(self, k1):
+        left, right, parent = self.left, self.right, self.parent
+        k2 = right[k1]
+        middle = left[k2]
+        right[k1] = middle
+        if middle:
+            parent[middle] = k1
+        left[k2] = k1
+        parent[k2] = parent[k1]
+        parent[k1] = k2
+        self._update_height(k1)
+        self._update_height(k2)
+        return k2
+
+    # Restore the AVL property at node, returns the new root of the subtree
+    def _rebalance(self, node, left_height, right_height):
+        heights = self.heights
+        if left_height > right_height:
+            child = self.left[node]
+            if heights[self.right[child]] > heights[self.left[child]]:
+                # Zig-Zag
+                self.left[node] = self._rotate_with_right_child(child)
+            # Zig-Zig
+            return self._rotate_with_left_child(node)
+
+        child = self.right[node]
+        if heights[self.left[child]] > heights[self.right[child]]:
+            # Zag-Zig
+            self.right[node] = self._rotate_with_left_child(child)
+        # Zag-Zag
+        return self._rotate_with_right_child(node)
+
+    # Same walk as AvlTree._retrace, on slot indices
+    def _retrace(self, node):
+        left, right, parent, heights = (
+            self.left, self.right, self.parent, self.heights)
+        while node:
+            up = parent[node]
+            old_height = heights[node]
+            left_height = heights[left[node]]
+            right_height = heights[right[node]]
+            if left_height - right_height > 1 or right_height - left_height > 1:
+                subtree = self._rebalance(node, left_height, right_height)
+                if not up:
+                    self.root = subtree
+                elif left[up] == node:
+                    left[up] = subtree
+                else:
+                    right[up] = subtree
+                node = subtree
+            else:
+                heights[node] = 1 + (left_height if left_height > right_height
+                                     else right_height)
+            if heights[node] == old_height:
+                return
+            node = up
+
+    def _find_slot(self, value):
+        keys, left, right = self.keys, self.left, self.right
+        cur = self.root
+        while cur and keys[cur] != value:
+            if value < keys[cur]:
+                cur = left[cur]
+            else:
+                cur = right[cur]
+        return cur
+
+    # Builds a detached TreeNode for the key in slot, with its neighbours
+    # filled in, so callers can inspect it like a node of the linked tree
+    def _node_at(self, slot):
+        node = TreeNode(self.keys[slot])
+        for attr in ('left', 'right', 'parent'):
+            other = getattr(self, attr)[slot]
+            if other:
+                setattr(node, attr, TreeNode(self.keys[other]))
+        return node
+
+    def insert(self, value):
+        if tracing.enabled:
+            log.debug("Inserting value {} into tree {}".format(value, self.name))
+        if isinstance(value, TreeNode):
+            value = value.value
+        keys, left, right = self.keys, self.left, self.right
+        parent = 0
+        cur = self.root
+        while cur:
+            parent = cur
+            if value < keys[cur]:
+                cur = left[cur]
+            else:
+                cur = right[cur]
+
+        node = self._alloc(value, parent)
+        self.size += 1
+        self.key_snapshot = None
+        if not parent:
+            self.root = node
+            return
+        if value < keys[parent]:
+            left[parent] = node
+        else:
+            right[parent] = node
+        self._retrace(parent)
+
+    def find(self, value):
+        if tracing.enabled:
+            log.debug("Finding value {} in tree {}".format(value, self.name))
+        if isinstance(value, TreeNode):
+            value = value.value
+        slot = self._find_slot(value)
+        if not slot:
+            raise ValueError
+        return self._node_at(slot)
+
+    # Removes one occurrence of value, returns False if it is not present
+    def _delete_value(self, value):
+        keys, left, right, parent = self.keys, self.left, self.right, self.parent
+        node = self._find_slot(value)
+        if not node:
+            return False
+
+        if left[node] and right[node]:
+            # Internal node, take over the key of the in-order successor and
+            # remove the successor instead, it has no left child
+            successor = right[node]
+            while left[successor]:
+                successor = left[successor]
+            keys[node] = keys[successor]
+            node = successor
+
+        child = left[node] if left[node] else right[node]
+        up = parent[node]
+        if child:
+            parent[child] = up
+        if not up:
+            self.root = child
+        elif left[up] == node:
+            left[up] = child
+        else:
+            right[up] = child
+        self._release(node)
+        self.size -= 1
+        self.key_snapshot = None
+        self._retrace(up)
+        return True
+
+    def delete(self, value):
+        if tracing.enabled:
+            log.debug("Deleting value {} in tree {}".format(value, self.name))
+        if isinstance(value, TreeNode):
+            value = value.value
+        if not self._delete_value(value):
+            if tracing.enabled:
+                log.debug("The value {} was not found in the tree {}".format(
+                    value, self.name))
+
+    def delete_min(self):
+        if tracing.enabled:
+            log.debug("ExtractMin for tree {}".format(self.name))
+        if not self.root:
+            raise ValueError
+        slot = self.root
+        while self.left[slot]:
+            slot = self.left[slot]
+        node = TreeNode(self.keys[slot])
+        self._delete_value(node.value)
+        return node
+
+    def delete_many(self, keys):
+        deleted = 0
+        missing = 0
+        for key in keys:
+            if self._delete_value(key):
+                deleted += 1
+            else:
+                missing += 1
+        return deleted, missing
+
+    def _dump_root(self):
+        return self.root if self.root else None
+
+    def _dump_node(self, node):
+        return (self.keys[node],
+                self.left[node] if self.left[node] else None,
+                self.right[node] if self.right[node] else None)
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+    tracing.set_trace(numLogLevel <= logging.DEBUG)
+
+    tree = PooledAvlTree("Test")
+    for i in range(10):
+        tree.insert(random.randint(-100, 100))
+
+    for i in range(4):
+        value = int(input("To Delete: "))
+        tree.delete(value)
+        print("Tree:\n", tree)
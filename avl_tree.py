@@ -1,32 +1,80 @@
 from binary_tree import TreeNode, BinaryTree
 import logging
+import tracing
 from argparse import ArgumentParser
 import random
+import heapq
+import gc
+import os
+from array import array
+from snapshot import read_snapshot, write_snapshot
+from frozen_index import FrozenAvlIndex
 
 log = logging.getLogger()
 
+SNAPSHOT_MAGIC = b'AVLT'
+
+# Batches of at least this fraction of the tree are merged with its keys and
+# rebuilt instead of applied one key at a time. Applying k keys costs about
+# k * height comparisons plus k new nodes, a rebuild n + k new nodes, and a
+# new node costs far more than a comparison step. Timed on trees of 200000
+# keys, both insert_many and delete_many break even at about k = 0.4 n
+REBUILD_FRACTION = 1.0 / 3
+
 class AvlTreeNode(TreeNode):
+    __slots__ = ('balance_factor', 'subtree_height', 'subtree_size')
+
     def __init__(self, value):
         TreeNode.__init__(self, value)
         self.balance_factor = 0
+        # Height of the subtree rooted at this node, a leaf has height 1
+        self.subtree_height = 1
+        # Number of keys in the subtree rooted at this node
+        self.subtree_size = 1
+
+    # The height is cached on the node, so this is O(1) instead of a full walk
+    def height(self):
+        return self.subtree_height
+
+    # Recompute the cached height and size from the (already correct) children
+    def update_subtree(self):
+        height = 0
+        size = 1
+        if self.left:
+            height = self.left.subtree_height
+            size += self.left.subtree_size
+        if self.right:
+            if self.right.subtree_height > height:
+                height = self.right.subtree_height
+            size += self.right.subtree_size
+        self.subtree_height = 1 + height
+        self.subtree_size = size
 
     # Trigger recalculation of the balance factor
     def height_difference(self):
         self.balance_factor = 0
         if self.left:
-            self.balance_factor -= (self.left.height())
+            self.balance_factor -= self.left.subtree_height
         if self.right:
-            self.balance_factor += (self.right.height())
+            self.balance_factor += self.right.subtree_height
 
-        log.debug("After calculating balance factor: {}".format(self.balance_factor))
+        if tracing.enabled:
+            log.debug("After calculating balance factor: {}".format(self.balance_factor))
         return self.balance_factor
 
 class AvlTree(BinaryTree):
+    # Cost of one operation (bulk-load per key) by tests.py operation name,
+    # checked by complexity.py
+    complexity = {'insert': 'log n', 'find-hit': 'log n', 'find-miss': 'log n',
+                  'delete': 'log n', 'delete-min': 'log n',
+                  'bulk-load': 'log n', 'height': '1'}
+
     def __init__(self, name):
         BinaryTree.__init__(self, name)
 
     def _rotate_with_left_child(self, k2):
-        log.debug("Rotating node {} to the right, child {}".format(k2, k2.left))
+        if tracing.enabled:
+            log.debug("Rotating node {} to the right, child {}".format(k2, k2.left))
         k1 = k2.left
         if k1:
             k2.left = k1.right
@@ -34,11 +82,15 @@ class AvlTree(BinaryTree):
                 k1.right.parent = k2
             k1.right = k2
             k1.parent = k2.parent
-        k2.parent = k1
+            k2.parent = k1
+            # k2 is now below k1, so its height has to be fixed first
+            k2.update_subtree()
+            k1.update_subtree()
         return k1
 
     def _rotate_with_right_child(self, k1):
-        log.debug("Rotating node {} to the left, child {}".format(k1, k1.right))
+        if tracing.enabled:
+            log.debug("Rotating node {} to the left, child {}".format(k1, k1.right))
         k2 = k1.right
         if k2:
             k1.right = k2.left
@@ -46,7 +98,9 @@ class AvlTree(BinaryTree):
                 k2.left.parent = k1
             k2.left = k1
             k2.parent = k1.parent
-        k1.parent = k2
+            k1.parent = k2
+            k1.update_subtree()
+            k2.update_subtree()
         return k2
 
     def _double_rotate_left_child(self, k3):
@@ -63,115 +117,496 @@ class AvlTree(BinaryTree):
             temp.parent = k1
         return self._rotate_with_right_child(k1)
 
-    def insert(self, node):
-        log.debug("Inserting node {}".format(node))
-        if type(node) == int:
-            node = AvlTreeNode(node)
-        self.root = self._insert_recursive(self.root, node)
-        self.size += 1
-
-    def _insert_recursive(self, root, key):
-        if not root:
-            return key
-        elif key < root:
-            log.debug("Going left at node {}".format(root))
-            root.left = self._insert_recursive(root.left, key)
-            key.parent = root
-            log.debug("Parent of key {} is {}".format(key, root))
-        else:
-            log.debug("Going right at node {}".format(root))
-            root.right = self._insert_recursive(root.right, key)
-            key.parent = root
-            log.debug("Parent of key {} is {}".format(key, root))
+    # Restore the AVL property at root, returns the new root of the subtree
+    def _rebalance(self, root):
         balance = root.height_difference()
-        log.debug("Balance for node {} is {}".format(root, balance))
+        if tracing.enabled:
+            log.debug("Balance for node {} is {}".format(root, balance))
 
+        # Pick the case from the child's balance rather than comparing the key
+        # against the child, equal keys would otherwise match none of the cases
         # Case 1 - Zig-Zig
-        if balance < -1 and key < root.left:
-            log.debug("Zig-Zig at node {}".format(root))
+        if balance < -1 and root.left.height_difference() <= 0:
+            if tracing.enabled:
+                log.debug("Zig-Zig at node {}".format(root))
             return self._rotate_with_left_child(root)
 
         # Case 2 - Zag-Zag
-        if balance > 1 and key > root.right:
-            log.debug("Zag-Zag at node {}".format(root))
+        if balance > 1 and root.right.height_difference() >= 0:
+            if tracing.enabled:
+                log.debug("Zag-Zag at node {}".format(root))
             return self._rotate_with_right_child(root)
 
         # Case 3 - Zig-Zag
-        if balance < -1 and key > root.left:
-            log.debug("Zig-Zag at node {}".format(root))
+        if balance < -1 and root.left.height_difference() > 0:
+            if tracing.enabled:
+                log.debug("Zig-Zag at node {}".format(root))
             return self._double_rotate_left_child(root)
 
         # Case 4 - Zag-Zig
-        if balance > 1 and key < root.right:
-            log.debug("Zag-Zig at node {}".format(root))
+        if balance > 1 and root.right.height_difference() < 0:
+            if tracing.enabled:
+                log.debug("Zag-Zig at node {}".format(root))
             return self._double_rotate_right_child(root)
 
         return root
 
+    # Walk up from node to the root through the parent pointers, fixing the
+    # cached heights and rotating where needed. Once a subtree keeps its old
+    # height no rotation can happen above it, only the sizes still change
+    def _retrace(self, node):
+        while node:
+            parent = node.parent
+            old_height = node.subtree_height
+            node.update_subtree()
+            balance = node.height_difference()
+            if balance < -1 or balance > 1:
+                subtree = self._rebalance(node)
+                if not parent:
+                    self.root = subtree
+                elif parent.left is node:
+                    parent.left = subtree
+                else:
+                    parent.right = subtree
+                node = subtree
+            if node.subtree_height == old_height:
+                while parent:
+                    parent.subtree_size = 1 + (
+                        (parent.left.subtree_size if parent.left else 0) +
+                        (parent.right.subtree_size if parent.right else 0))
+                    parent = parent.parent
+                return
+            node = parent
+
+    def length(self):
+        if not self.root:
+            return 0
+        return self.root.subtree_size
+
+    # Number of keys smaller than value, or not larger if inclusive is set
+    def _count_below(self, value, inclusive=False):
+        count = 0
+        cur = self.root
+        while cur:
+            if cur.value < value or (inclusive and cur.value == value):
+                count += 1
+                if cur.left:
+                    count += cur.left.subtree_size
+                cur = cur.right
+            else:
+                cur = cur.left
+        return count
+
+    # Position value would have in the sorted keys, i.e. the number of keys
+    # smaller than it
+    def rank(self, value):
+        if isinstance(value, TreeNode):
+            value = value.value
+        return self._count_below(value)
+
+    # The node holding the k-th smallest key, counting from 0
+    def select(self, k):
+        if k < 0 or k >= self.length():
+            raise ValueError("Rank {} is out of range".format(k))
+        cur = self.root
+        while cur:
+            left = cur.left.subtree_size if cur.left else 0
+            if k < left:
+                cur = cur.left
+            elif k == left:
+                return cur
+            else:
+                k -= left + 1
+                cur = cur.right
+
+    def _successor(self, node):
+        if node.right:
+            return self._find_min(node.right)
+        while node.parent and node is node.parent.right:
+            node = node.parent
+        return node.parent
+
+    def _predecessor(self, node):
+        if node.left:
+            node = node.left
+            while node.right:
+                node = node.right
+            return node
+        while node.parent and node is node.parent.left:
+            node = node.parent
+        return node.parent
+
+    # The keys in ascending order. Each step follows the child / parent
+    # pointers from the previous node, so there is no stack and no list, and
+    # a full walk touches every edge twice. The tree must not change meanwhile
+    def __iter__(self):
+        node = self._find_min(self.root)
+        while node:
+            yield node.value
+            node = self._successor(node)
+
+    def __reversed__(self):
+        node = self.root
+        while node and node.right:
+            node = node.right
+        while node:
+            yield node.value
+            node = self._predecessor(node)
+
+    # The keys between lo and hi, both included, in ascending order
+    def range(self, lo, hi):
+        # Find the first node that is not smaller than lo
+        start = None
+        cur = self.root
+        while cur:
+            if cur.value < lo:
+                cur = cur.right
+            else:
+                start = cur
+                cur = cur.left
+
+        node = start
+        while node and not hi < node.value:
+            yield node.value
+            node = self._successor(node)
+
+    # Number of keys between lo and hi, both included
+    def count_range(self, lo, hi):
+        if hi < lo:
+            return 0
+        return self._count_below(hi, inclusive=True) - self._count_below(lo)
+
+    # Build a perfectly balanced subtree from the next count keys, taken in
+    # order from next_key: the first half goes to the left subtree, then the
+    # root, then the rest to the right, so the two halves differ by at most
+    # one node. The keys are read once, front to back, so they can come from
+    # an iterator
+    def _build_sorted(self, next_key, count):
+        if not count:
+            return None
+        left = self._build_sorted(next_key, count // 2)
+        node = AvlTreeNode(next_key())
+        right = self._build_sorted(next_key, count - count // 2 - 1)
+        node.left = left
+        node.right = right
+        if left:
+            left.parent = node
+        if right:
+            right.parent = node
+        node.update_subtree()
+        return node
+
+    # Replace the contents of the tree by count keys from the sorted iterator
+    # keys in O(n)
+    def _load_stream(self, keys, count):
+        self._delete_nodes(self.root)
+        # Every node is reachable while the tree is built, so the collections
+        # the allocations would trigger can't free anything and only cost time
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self.root = self._build_sorted(iter(keys).__next__, count)
+        finally:
+            if collecting:
+                gc.enable()
+        self.size = count
+        self.key_snapshot = None
+
+    # Replace the contents of the tree by the sorted keys in O(n)
+    def _load_sorted(self, keys):
+        for i in range(1, len(keys)):
+            if keys[i] < keys[i - 1]:
+                raise ValueError("Keys are not sorted at position {}".format(i))
+        self._load_stream(keys, len(keys))
+
+    @classmethod
+    def from_sorted(cls, name, keys):
+        tree = cls(name)
+        if not isinstance(keys, (list, array)):
+            keys = list(keys)
+        tree._load_sorted(keys)
+        return tree
+
+    # Write the keys in order to a binary snapshot, see snapshot.py
+    def save(self, path):
+        write_snapshot(path, SNAPSHOT_MAGIC, [(iter(self), self.length())])
+
+    # Rebuild a tree from a snapshot in O(n), the keys are already sorted so
+    # the tree is built balanced without any rotation
+    @classmethod
+    def load(cls, path, name=None):
+        (keys,) = read_snapshot(path, SNAPSHOT_MAGIC)
+        return cls.from_sorted(name or os.path.basename(path), keys)
+
+    # Immutable Eytzinger array copy of the keys for trees that no longer
+    # change, see frozen_index.py. It can be saved and mapped by other processes
+    def freeze(self, name=None):
+        keys = array('q', iter(self))
+        return FrozenAvlIndex.from_sorted(name or self.name, keys)
+
+    # Sort the keys once and build the tree from them, which is cheaper than
+    # inserting (and rebalancing) one key at a time
+    def bulk_load(self, keys):
+        if tracing.enabled:
+            log.debug("Bulk loading keys into tree {}".format(self.name))
+        return self.insert_many(keys)
+
+    # All keys of the tree in sorted order
+    def _sorted_values(self):
+        values = []
+        stack = []
+        cur = self.root
+        while stack or cur:
+            while cur:
+                stack.append(cur)
+                cur = cur.left
+            cur = stack.pop()
+            values.append(cur.value)
+            cur = cur.right
+        return values
+
+    def _snapshot_keys(self):
+        return self._sorted_values()
+
+    # See REBUILD_FRACTION
+    def _rebuild_is_cheaper(self, batch_size):
+        return batch_size >= REBUILD_FRACTION * self.length()
+
+    # Insert all keys, returns the number of keys inserted
+    def insert_many(self, keys):
+        batch = sorted(key.value if isinstance(key, TreeNode) else key
+                       for key in keys)
+        if tracing.enabled:
+            log.debug("Inserting {} keys into tree {}".format(len(batch), self.name))
+        if not self.root:
+            self._load_sorted(batch)
+        elif self._rebuild_is_cheaper(len(batch)):
+            self._load_sorted(list(heapq.merge(self._sorted_values(), batch)))
+        else:
+            for key in batch:
+                self._insert_iterative(AvlTreeNode(key))
+                self.size += 1
+            self.key_snapshot = None
+        return len(batch)
+
+    # Insert the keys of an iterable of batches. An empty tree is built in one
+    # pass: every batch is sorted into a run of int64, 8 bytes per key, and
+    # the tree is built from the merge of the runs, without a list of all the
+    # keys. A tree that has keys takes one batch at a time
+    def insert_batches(self, batches):
+        if self.root:
+            return BinaryTree.insert_batches(self, batches)
+        runs = []
+        count = 0
+        for batch in batches:
+            keys = sorted(key.value if isinstance(key, TreeNode) else key
+                          for key in batch)
+            try:
+                runs.append(array('q', keys))
+            except OverflowError:
+                # Keys that don't fit in 64 bits, keep the run as a list
+                runs.append(keys)
+            count += len(keys)
+        if tracing.enabled:
+            log.debug("Building tree {} from {} keys in {} runs".format(
+                self.name, count, len(runs)))
+        self._load_stream(heapq.merge(*runs), count)
+        return count
+
+    # Delete one occurrence of every key, returns the number of keys that were
+    # deleted and the number of keys that were not in the tree
+    def delete_many(self, keys):
+        batch = sorted(key.value if isinstance(key, TreeNode) else key
+                       for key in keys)
+        if tracing.enabled:
+            log.debug("Deleting {} keys from tree {}".format(len(batch), self.name))
+        deleted = 0
+        if self.root and self._rebuild_is_cheaper(len(batch)):
+            # Walk both sorted lists side by side and keep what is not deleted
+            values = self._sorted_values()
+            kept = []
+            i = 0
+            for key in batch:
+                while i < len(values) and values[i] < key:
+                    kept.append(values[i])
+                    i += 1
+                if i < len(values) and values[i] == key:
+                    i += 1
+                    deleted += 1
+            kept.extend(values[i:])
+            self._load_sorted(kept)
+        else:
+            for key in batch:
+                if self._delete_iterative(key):
+                    deleted += 1
+        return deleted, len(batch) - deleted
+
+    def insert(self, node):
+        if tracing.enabled:
+            log.debug("Inserting node {}".format(node))
+        if type(node) == int:
+            node = AvlTreeNode(node)
+        self._insert_iterative(node)
+        self.size += 1
+        self.key_snapshot = None
+
+    def _insert_iterative(self, node):
+        value = node.value
+        parent = None
+        cur = self.root
+        while cur:
+            parent = cur
+            if value < cur.value:
+                cur = cur.left
+            else:
+                cur = cur.right
+
+        node.parent = parent
+        if not parent:
+            self.root = node
+            return
+        if value < parent.value:
+            parent.left = node
+        else:
+            parent.right = node
+        self._retrace(parent)
+
+    def _insert_recursive(self, root, key):
+        if not root:
+            return key
+        elif key < root:
+            if tracing.enabled:
+                log.debug("Going left at node {}".format(root))
+            root.left = self._insert_recursive(root.left, key)
+            root.left.parent = root
+            if tracing.enabled:
+                log.debug("Parent of node {} is {}".format(root.left, root))
+        else:
+            if tracing.enabled:
+                log.debug("Going right at node {}".format(root))
+            root.right = self._insert_recursive(root.right, key)
+            root.right.parent = root
+            if tracing.enabled:
+                log.debug("Parent of node {} is {}".format(root.right, root))
+        root.update_subtree()
+        return self._rebalance(root)
+
+    # Unlinks the node holding value, returns the node that was physically
+    # removed from the tree or None if the value is not present
+    def _delete_iterative(self, value):
+        cur = self.root
+        while cur and cur.value != value:
+            if value < cur.value:
+                cur = cur.left
+            else:
+                cur = cur.right
+        if not cur:
+            return None
+
+        if cur.left and cur.right:
+            # Internal node, take over the value of the in-order successor and
+            # remove the successor instead, it has no left child
+            successor = self._find_min(cur.right)
+            cur.value = successor.value
+            cur = successor
+
+        child = cur.left if cur.left else cur.right
+        parent = cur.parent
+        if child:
+            child.parent = parent
+        if not parent:
+            self.root = child
+        elif parent.left is cur:
+            parent.left = child
+        else:
+            parent.right = child
+        cur.left = cur.right = cur.parent = None
+        self.size -= 1
+        self.key_snapshot = None
+
+        self._retrace(parent)
+        return cur
+
     def _delete_recursvive(self, root, key):
         if not root:
             return root
 
         if key < root:
-            log.debug("Going left at node {}".format(root))
+            if tracing.enabled:
+                log.debug("Going left at node {}".format(root))
             root.left = self._delete_recursvive(root.left, key)
+            if root.left:
+                root.left.parent = root
         elif key > root:
-            log.debug("Going right at node {}".format(root))
+            if tracing.enabled:
+                log.debug("Going right at node {}".format(root))
             root.right = self._delete_recursvive(root.right, key)
+            if root.right:
+                root.right.parent = root
         else:
-            log.debug("Found the node at {}".format(root))
+            if tracing.enabled:
+                log.debug("Found the node at {}".format(root))
             if root.left is None:
-                log.debug("Node has no left child")
+                if tracing.enabled:
+                    log.debug("Node has no left child")
                 temp = root.right
                 root = None
                 self.size -= 1
+                self.key_snapshot = None
                 return temp
 
             elif root.right is None:
-                log.debug("Node has no right child")
+                if tracing.enabled:
+                    log.debug("Node has no right child")
                 temp = root.left
                 root = None
                 self.size -= 1
+                self.key_snapshot = None
                 return temp
 
-            log.debug("Node is an internal node")
+            if tracing.enabled:
+                log.debug("Node is an internal node")
             temp = self._find_min(root.right)
             root.value = temp.value
             root.right = self._delete_recursvive(root.right,
                                                  temp)
+            if root.right:
+                root.right.parent = root
 
-        balance = root.height_difference()
-        log.debug("Height difference of node {} is {}".format(root, balance))
-
-        # Case 1 - Zig-Zig
-        if balance < -1 and root.left.height_difference() < 0:
-            log.debug("Zig-Zig rotation at node {}".format(root))
-            return self._rotate_with_left_child(root)
-
-        # Case 2 - Zag-Zag
-        if balance > 1 and root.right.height_difference() >= 0:
-            log.debug("Zag-Zag rotation at node {}".format(root))
-            return self._rotate_with_right_child(root)
-
-        # Case 3 - Zig-Zag
-        if balance < -1 and root.left.height_difference() >= 0:
-            log.debug("Zig-Zag rotation at node {}".format(root))
-            return self._double_rotate_left_child(root)
-
-        # Case 4 - Zag-Zig
-        if balance > 1 and root.right.height_difference() <= 0:
-            log.debug("Zag-Zig rotation at node {}".format(root))
-            return self._double_rotate_right_child(root)
-
-        return root
+        root.update_subtree()
+        return self._rebalance(root)
 
     def delete(self, node):
-        log.debug('Deleting node {} in Tree {}'.format(node, self.name))
+        if tracing.enabled:
+            log.debug('Deleting node {} in Tree {}'.format(node, self.name))
         if type(node) == int:
             node = AvlTreeNode(node)
 
-        self.root = self._delete_recursvive(self.root, node)
-
+        if not self._delete_iterative(node.value):
+            if tracing.enabled:
+                log.debug("The value {} was not found in the tree {}".format(
+                    node, self.name))
+
+    # Removes the smallest key and returns its node, like the heaps do. The
+    # minimum has no left child, so it is unlinked directly
+    def delete_min(self):
+        if tracing.enabled:
+            log.debug("ExtractMin for tree {}".format(self.name))
+        if not self.root:
+            raise ValueError
+        node = self._find_min(self.root)
+        parent = node.parent
+        if node.right:
+            node.right.parent = parent
+        if not parent:
+            self.root = node.right
+        else:
+            parent.left = node.right
+        node.right = node.parent = None
+        self.size -= 1
+        self.key_snapshot = None
+        self._retrace(parent)
+        return node
 
 if __name__ == '__main__':
     parser = ArgumentParser()
@@ -185,6 +620,7 @@ if __name__ == '__main__':
     numLogLevel = getattr(logging, logLevel.upper())
     logging.basicConfig(level=numLogLevel)
     log.setLevel(numLogLevel)
+    tracing.set_trace(numLogLevel <= logging.DEBUG)
 
     tree = AvlTree("Test")
     for i in range(10):
@@ -0,0 +1,417 @@
+import sys
+import time
+import logging
+import os
+import tracemalloc
+from argparse import ArgumentParser
+from random import randint, random
+
+from avl_tree import AvlTree, AvlTreeNode
+from avl_pool import PooledAvlTree
+from binary_tree import TreeNode
+import tracing
+from bin_heap import BinaryMinHeap, DaryMinHeap, LinkedBinaryMinHeap
+from pairing_heap import PairingHeap
+from frozen_index import FrozenAvlIndex
+
+
+# Inserting keys one at a time should cost O(log n) each, so the average time
+# per insert must stay (nearly) flat while the tree grows by orders of magnitude
+def bench_avl_insert(sizes, batch=1000):
+    print("{:>12} {:>16}".format("Tree size", "us / insert"))
+    tree = AvlTree("Benchmark")
+    for size in sizes:
+        while tree.length() < size:
+            tree.insert(randint(1000000000, 9999999999))
+
+        keys = [randint(1000000000, 9999999999) for _ in range(batch)]
+        t1 = time.perf_counter()
+        for key in keys:
+            tree.insert(key)
+        t2 = time.perf_counter()
+        print("{:>12} {:>16.2f}".format(size, (t2 - t1) * 1e6 / batch))
+
+
+# Per operation cost of the recursive and the iterative (parent pointer) AVL
+# engines, both run against the same tree so the depths are identical
+def bench_avl_engines(sizes, batch=1000):
+    print("{:>12} {:>14} {:>14} {:>14} {:>14}".format(
+        "Tree size", "rec insert", "iter insert", "rec delete", "iter delete"))
+    tree = AvlTree("Benchmark")
+    for size in sizes:
+        while tree.length() < size:
+            tree.insert(randint(1000000000, 9999999999))
+        keys = [randint(1000000000, 9999999999) for _ in range(batch)]
+
+        t1 = time.perf_counter()
+        for key in keys:
+            tree.root = tree._insert_recursive(tree.root, AvlTreeNode(key))
+            tree.size += 1
+        t2 = time.perf_counter()
+        for key in keys:
+            tree.root = tree._delete_recursvive(tree.root, AvlTreeNode(key))
+        t3 = time.perf_counter()
+        for key in keys:
+            tree._insert_iterative(AvlTreeNode(key))
+            tree.size += 1
+        t4 = time.perf_counter()
+        for key in keys:
+            tree._delete_iterative(key)
+        t5 = time.perf_counter()
+
+        print("{:>12} {:>14.2f} {:>14.2f} {:>14.2f} {:>14.2f}".format(
+            size, (t2 - t1) * 1e6 / batch, (t4 - t3) * 1e6 / batch,
+            (t3 - t2) * 1e6 / batch, (t5 - t4) * 1e6 / batch))
+
+
+# Per operation cost of the array backed heap against the linked heap
+def bench_heap_engines(sizes, batch=1000):
+    print("{:>12} {:>10} {:>14} {:>14}".format(
+        "Heap size", "Engine", "insert", "delete_min"))
+    for size in sizes:
+        keys = [randint(1000000000, 9999999999) for _ in range(size)]
+        batch_keys = [randint(1000000000, 9999999999) for _ in range(batch)]
+        for engine in (LinkedBinaryMinHeap, BinaryMinHeap):
+            heap = engine("Benchmark")
+            for key in keys:
+                heap.insert(key)
+
+            t1 = time.perf_counter()
+            for key in batch_keys:
+                heap.insert(key)
+            t2 = time.perf_counter()
+            for _ in range(batch):
+                heap.delete_min()
+            t3 = time.perf_counter()
+
+            print("{:>12} {:>10} {:>14.2f} {:>14.2f}".format(
+                size, "linked" if engine is LinkedBinaryMinHeap else "array",
+                (t2 - t1) * 1e6 / batch, (t3 - t2) * 1e6 / batch))
+
+
+# Same attributes as the slotted nodes, laid out the way the node classes were
+# before they got __slots__, i.e. with a per-instance __dict__
+class DictTreeNode(object):
+    def __init__(self, value):
+        self.left = None
+        self.right = None
+        self.value = value
+        self.parent = None
+
+
+class DictAvlTreeNode(DictTreeNode):
+    def __init__(self, value):
+        DictTreeNode.__init__(self, value)
+        self.balance_factor = 0
+        self.subtree_height = 1
+        self.subtree_size = 1
+
+
+def node_bytes(node_class, count):
+    nodes = [None] * count
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        nodes[i] = node_class(1000000000 + i)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # Every node holds its own int object, which is not part of the node
+    value_bytes = sys.getsizeof(1000000000)
+    return (after - before) / count - value_bytes
+
+
+# Bytes per node with and without __slots__, as seen by tracemalloc
+def bench_node_memory(sizes):
+    print("{:>12} {:>14} {:>12} {:>12}".format(
+        "Nodes", "Node", "__dict__", "__slots__"))
+    for size in sizes:
+        for name, plain, slotted in (("TreeNode", DictTreeNode, TreeNode),
+                                     ("AvlTreeNode", DictAvlTreeNode, AvlTreeNode)):
+            print("{:>12} {:>14} {:>12.1f} {:>12.1f}".format(
+                size, name, node_bytes(plain, size), node_bytes(slotted, size)))
+
+
+# Bytes per key of a whole tree, keys included, and the insert / delete cost
+# of the object based AVL tree against the array backed node pool
+def bench_pool(sizes):
+    print("{:>12} {:>14} {:>12} {:>12} {:>12}".format(
+        "Keys", "Engine", "bytes/key", "us/insert", "us/delete"))
+    for size in sizes:
+        keys = [randint(0, 8999999999) for _ in range(size)]
+        for engine in (AvlTree, PooledAvlTree):
+            tree = engine("Benchmark")
+            tracemalloc.start()
+            t1 = time.perf_counter()
+            for key in keys:
+                # A fresh int per key, like keys parsed from a file
+                tree.insert(key + 1000000000)
+            t2 = time.perf_counter()
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            t3 = time.perf_counter()
+            for key in keys:
+                tree.delete(key + 1000000000)
+            t4 = time.perf_counter()
+            print("{:>12} {:>14} {:>12.1f} {:>12.2f} {:>12.2f}".format(
+                size, engine.__name__, used / size,
+                (t2 - t1) * 1e6 / size, (t4 - t3) * 1e6 / size))
+
+
+def time_operations(engine, keys):
+    tree = engine("Benchmark")
+    t1 = time.perf_counter()
+    for key in keys:
+        tree.insert(key)
+    for key in keys:
+        tree.find(key)
+    for key in keys:
+        tree.delete(key)
+    return time.perf_counter() - t1
+
+
+# The engines log at DEBUG, so at INFO every trace point used to build its
+# message only for the logger to drop it. Tracing on reproduces that cost
+def bench_logging(sizes):
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger().setLevel(logging.INFO)
+    print("{:>12} {:>14} {:>14} {:>14} {:>10}".format(
+        "Keys", "Engine", "traced (s)", "untraced (s)", "speedup"))
+    for size in sizes:
+        keys = [randint(1000000000, 9999999999) for _ in range(size)]
+        for engine in (AvlTree, BinaryMinHeap, PooledAvlTree):
+            tracing.set_trace(True)
+            traced = time_operations(engine, keys)
+            tracing.set_trace(False)
+            untraced = time_operations(engine, keys)
+            print("{:>12} {:>14} {:>14.3f} {:>14.3f} {:>9.1f}x".format(
+                size, engine.__name__, traced, untraced, traced / untraced))
+
+
+# Time and peak traced memory to dump a tree to a file in both formats
+def bench_dump(sizes):
+    print("{:>12} {:>10} {:>12} {:>14}".format(
+        "Nodes", "Format", "seconds", "peak KiB"))
+    for size in sizes:
+        tree = AvlTree.from_sorted("Benchmark", range(size))
+        for compact in (False, True):
+            with open(os.devnull, "w") as fp:
+                t1 = time.perf_counter()
+                tree.dump(fp, compact=compact)
+                t2 = time.perf_counter()
+                # Separate run, tracemalloc slows the dump down a lot
+                tracemalloc.start()
+                tree.dump(fp, compact=compact)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            print("{:>12} {:>10} {:>12.3f} {:>14.1f}".format(
+                size, "compact" if compact else "tree", t2 - t1, peak / 1024))
+
+
+# The combined heap operations against the insert / delete_min call sequence
+# they replace, on a top-k style stream of keys
+def bench_heap_fastpaths(sizes, batch=10000):
+    print("{:>12} {:>22} {:>12} {:>12}".format(
+        "Heap size", "Operation", "sequence", "fast path"))
+    for size in sizes:
+        keys = [randint(1000000000, 9999999999) for _ in range(size)]
+        stream = [randint(1000000000, 9999999999) for _ in range(batch)]
+
+        heap = BinaryMinHeap.from_iterable("Benchmark", keys)
+        t1 = time.perf_counter()
+        for key in stream:
+            heap.insert(key)
+            heap.delete_min()
+        t2 = time.perf_counter()
+        for key in stream:
+            heap.pushpop(key)
+        t3 = time.perf_counter()
+        print("{:>12} {:>22} {:>12.2f} {:>12.2f}".format(
+            size, "insert+delete_min (us)", (t2 - t1) * 1e6 / batch,
+            (t3 - t2) * 1e6 / batch))
+
+        t1 = time.perf_counter()
+        for key in stream:
+            heap.delete_min()
+            heap.insert(key)
+        t2 = time.perf_counter()
+        for key in stream:
+            heap.replace(key)
+        t3 = time.perf_counter()
+        print("{:>12} {:>22} {:>12.2f} {:>12.2f}".format(
+            size, "delete_min+insert (us)", (t2 - t1) * 1e6 / batch,
+            (t3 - t2) * 1e6 / batch))
+
+        k = min(batch, size // 2)
+        t1 = time.perf_counter()
+        [heap.delete_min().value for _ in range(k)]
+        t2 = time.perf_counter()
+        heap.pop_n(k)
+        t3 = time.perf_counter()
+        print("{:>12} {:>22} {:>12.2f} {:>12.2f}".format(
+            size, "pop {} (ms)".format(k), (t2 - t1) * 1e3, (t3 - t2) * 1e3))
+
+        # Without nsmallest the only way to peek is to pop and put back
+        t1 = time.perf_counter()
+        smallest = [heap.delete_min().value for _ in range(k)]
+        heap.insert_many(smallest)
+        t2 = time.perf_counter()
+        heap.nsmallest(k)
+        t3 = time.perf_counter()
+        print("{:>12} {:>22} {:>12.2f} {:>12.2f}".format(
+            size, "smallest {} (ms)".format(k), (t2 - t1) * 1e3,
+            (t3 - t2) * 1e3))
+
+
+# Combining shards: a pairing heap melds in O(1), a binary heap has to take
+# every key of the other shard
+def bench_meld(sizes, shards=8):
+    print("{:>12} {:>16} {:>16}".format(
+        "Shard size", "binary (ms)", "pairing (ms)"))
+    for size in sizes:
+        keys = [[randint(1000000000, 9999999999) for _ in range(size)]
+                for _ in range(shards)]
+        binary = BinaryMinHeap.from_iterable("Shard", keys[0])
+        pairing = [PairingHeap("Shard") for _ in keys]
+        for heap, shard in zip(pairing, keys):
+            for key in shard:
+                heap.insert(key)
+
+        t1 = time.perf_counter()
+        for shard in keys[1:]:
+            binary.insert_many(shard)
+        t2 = time.perf_counter()
+        for heap in pairing[1:]:
+            pairing[0].meld(heap)
+        t3 = time.perf_counter()
+        print("{:>12} {:>16.3f} {:>16.3f}".format(
+            size, (t2 - t1) * 1e3, (t3 - t2) * 1e3))
+
+
+# Heap arity against the share of inserts in an insert / delete_min mix. The
+# binary row is the specialised BinaryMinHeap, the others are DaryMinHeap
+def bench_dary(sizes, operations=100000):
+    print("{:>12} {:>10} {:>8} {:>14}".format(
+        "Heap size", "inserts", "d", "us / op"))
+    for size in sizes:
+        keys = [randint(1000000000, 9999999999) for _ in range(size)]
+        for share in (0.5, 0.75, 0.9):
+            ops = [randint(1000000000, 9999999999) if random() < share else None
+                   for _ in range(operations)]
+            for d in (2, 4, 8):
+                if d == 2:
+                    heap = BinaryMinHeap.from_iterable("Benchmark", keys)
+                else:
+                    heap = DaryMinHeap.from_iterable("Benchmark", keys, d=d)
+                t1 = time.perf_counter()
+                for key in ops:
+                    if key is None:
+                        heap.delete_min()
+                    else:
+                        heap.insert(key)
+                t2 = time.perf_counter()
+                print("{:>12} {:>9.0f}% {:>8} {:>14.2f}".format(
+                    size, share * 100, d, (t2 - t1) * 1e6 / operations))
+
+
+# Restart cost: saving / loading a binary snapshot against inserting every key
+# again, as reading the CSV back does
+def bench_snapshot(sizes, path="benchmark.snap"):
+    print("{:>12} {:>14} {:>10} {:>10} {:>12}".format(
+        "Keys", "Engine", "save (s)", "load (s)", "insert (s)"))
+    for size in sizes:
+        keys = [randint(1000000000, 9999999999) for _ in range(size)]
+        for engine in (AvlTree, BinaryMinHeap):
+            tree = engine("Benchmark")
+            t1 = time.perf_counter()
+            for key in keys:
+                tree.insert(key)
+            t2 = time.perf_counter()
+            tree.save(path)
+            t3 = time.perf_counter()
+            engine.load(path)
+            t4 = time.perf_counter()
+            print("{:>12} {:>14} {:>10.3f} {:>10.3f} {:>12.3f}".format(
+                size, engine.__name__, t3 - t2, t4 - t3, t2 - t1))
+    os.remove(path)
+
+
+# Lookups on a tree that no longer changes: the linked tree, its frozen
+# Eytzinger copy in memory and the same copy mapped from a file
+def bench_frozen(sizes, lookups=100000, path="benchmark.idx"):
+    print("{:>12} {:>14} {:>12} {:>12}".format(
+        "Keys", "Index", "find (s)", "rank (s)"))
+    for size in sizes:
+        keys = sorted(randint(1000000000, 9999999999) for _ in range(size))
+        probes = [keys[randint(0, size - 1)] for _ in range(lookups)]
+        tree = AvlTree.from_sorted("Benchmark", keys)
+        frozen = tree.freeze()
+        frozen.save(path)
+        mapped = FrozenAvlIndex.open(path)
+        for label, index in (("AvlTree", tree), ("Frozen", frozen),
+                             ("Mapped", mapped)):
+            t1 = time.perf_counter()
+            for key in probes:
+                index.find(key)
+            t2 = time.perf_counter()
+            for key in probes:
+                index.rank(key)
+            t3 = time.perf_counter()
+            print("{:>12} {:>14} {:>12.3f} {:>12.3f}".format(
+                size, label, t2 - t1, t3 - t2))
+        mapped.close()
+    os.remove(path)
+
+
+# Batch membership: one find per key against contains_many on the sorted
+# snapshot, the first contains_many call pays for taking the snapshot
+def bench_find_many(sizes, probes=1000000):
+    print("{:>12} {:>14} {:>12} {:>14} {:>12}".format(
+        "Keys", "Engine", "find (s)", "snapshot (s)", "many (s)"))
+    for size in sizes:
+        keys = [randint(0, 2 * size) for _ in range(size)]
+        queries = [randint(0, 2 * size) for _ in range(probes)]
+        for engine in (AvlTree, BinaryMinHeap):
+            tree = engine("Benchmark")
+            tree.insert_many(keys)
+            t1 = time.perf_counter()
+            for key in queries[:probes // 10]:
+                try:
+                    tree.find(key)
+                except ValueError:
+                    pass
+            t2 = time.perf_counter()
+            tree.contains_many(queries[:1])
+            t3 = time.perf_counter()
+            tree.contains_many(queries)
+            t4 = time.perf_counter()
+            # find only ran on a tenth of the probes
+            print("{:>12} {:>14} {:>12.3f} {:>14.3f} {:>12.3f}".format(
+                size, engine.__name__, 10 * (t2 - t1), t3 - t2, t4 - t3))
+
+
+BENCHMARKS = {
+    'avl-insert': bench_avl_insert,
+    'avl-engines': bench_avl_engines,
+    'heap-engines': bench_heap_engines,
+    'node-memory': bench_node_memory,
+    'pool': bench_pool,
+    'logging': bench_logging,
+    'dump': bench_dump,
+    'heap-fastpaths': bench_heap_fastpaths,
+    'meld': bench_meld,
+    'dary': bench_dary,
+    'snapshot': bench_snapshot,
+    'frozen': bench_frozen,
+    'find-many': bench_find_many,
+}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args.sizes)
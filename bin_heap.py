@@ -1,190 +1,730 @@
-from binary_tree import BinaryTree, TreeNode
-import logging
-from argparse import ArgumentParser
-import random
-log = logging.getLogger()
-
-class BinaryMinHeap(BinaryTree):
-    def __init__(self, name):
-        BinaryTree.__init__(self, name)
-
-    def _heapify(self, root):
-        while root and root.parent:
-            if root < root.parent:
-                # Swap
-                (root.parent.value, root.value) = (
-                    root.value, root.parent.value)
-            root = root.parent
-
-    def _insert(self, root, node):
-        if not root:
-            return node
-
-        queue = list([root])
-
-        while len(queue):
-            cur = queue.pop(0)
-            # Insert node in first open position while doing a BFS
-            if not cur.left:
-                log.debug("Found empty position at left of node {}".format(cur))
-                cur.left = node
-                node.parent = cur
-                break
-            elif not cur.right:
-                log.debug("Found empty position at right of node {}".format(cur))
-                cur.right = node
-                node.parent = cur
-                break
-            else:
-                queue.append(cur.left)
-                queue.append(cur.right)
-
-        log.debug("Heapifying from node {}".format(node))
-        self._heapify(node)
-        self.size += 1
-
-    def insert(self, value):
-        log.debug("Inserting value {} into Binary Heap {}".format(
-            value, self.name))
-        if type(value) == int:
-            value = TreeNode(value)
-        if not self.root:
-            self.root = value
-            self.size += 1
-            return
-        self._insert(self.root, value)
-
-    def find(self, node):
-        log.debug("Finding value {} into Binary Heap {}".format(node, self.name))
-        if type(node) == int:
-            node = TreeNode(node)
-        if not self.root:
-            raise ValueError
-
-        # Entire tree needs to be searched, try a BFS to find it
-        queue = list([self.root])
-        while len(queue):
-            cur = queue.pop(0)
-            if cur == node:
-                log.debug("Value found!")
-                return cur
-            if cur.left:
-                queue.append(cur.left)
-            if cur.right:
-                queue.append(cur.right)
-        raise ValueError
-
-    def _find_min(self):
-        log.debug("Finding min element in heap {}".format(self.name))
-        return self.root
-
-    def _find_last(self):
-        # To find the last element, do a BFS. The last element popped from the queue is the last element in the heap
-        if not self.root:
-            return None
-
-        queue = list([self.root])
-        last = None
-        while len(queue):
-            last = queue.pop(0)
-            if last.left:
-                queue.append(last.left)
-            if last.right:
-                queue.append(last.right)
-
-        log.debug("The last element is {}".format(last))
-        return last
-
-    def delete(self, node):
-        log.debug("Deleting node {} in Heap {}".format(node, self.name))
-        if type(node) == int:
-            node = TreeNode(node)
-
-        found = self.find(node)
-        last = self._find_last()
-        (found.value, last.value) = (last.value, found.value)
-
-        if not last.parent:
-            # Root is the only element
-            log.debug("Deleting the root element")
-            del last
-            self.root = None
-            return
-
-        # Reset pointers of last
-        if last == last.parent.left:
-            log.debug("The last node is it's parent's left child")
-            last.parent.left = None
-        else:
-            log.debug("The last node is it's parent's right child")
-            last.parent.right = None
-        del last
-        self.size -= 1
-        if not found.parent:
-            self.root = found
-        self._heapify_down(found)
-
-    def _heapify_down(self, node):
-        cur = node
-        while cur and (cur.left or cur.right):
-            if cur == min(cur, cur.left, cur.right):
-                break
-
-            if not cur.right:
-                # Only left exists
-                (cur.value, cur.left.value) = (cur.left.value, cur.value)
-                cur = cur.left
-            elif not cur.left:
-                # Only right exists
-                (cur.value, cur.right.value) = (cur.right.value, cur.value)
-                cur = cur.right
-            else:
-                if cur.left < cur.right:
-                    (cur.value, cur.left.value) = (cur.left.value, cur.value)
-                    cur = cur.left
-                else:
-                    (cur.value, cur.right.value) = (cur.right.value, cur.value)
-                    cur = cur.right
-    
-    def delete_min(self):
-        log.debug("ExtractMin for heap {}".format(self.name))
-        if not self.root:
-            raise ValueError
-        node = TreeNode(self._find_min().value)
-        self.delete(node)
-        return node
-
-if __name__ == '__main__':
-    parser = ArgumentParser()
-    parser.add_argument('--log')
-    args = parser.parse_args()
-    logLevel = args.log
-
-    if logLevel == None:
-        logLevel = "INFO"
-
-    numLogLevel = getattr(logging, logLevel.upper())
-    logging.basicConfig(level=numLogLevel)
-    log.setLevel(numLogLevel)
-
-    heap = BinaryMinHeap("Test")
-    for _ in range(10):
-        heap.insert(TreeNode(random.randint(-100, 100)))
-        print(heap)
-    """
-    for i in range(2):
-        value = int(input("To Find: "))
-        try:
-            heap.find(TreeNode(value))
-            print("Tree:\n", heap)
-        except ValueError:
-            print("Not Found!")
-    """
-
-    for i in range(4):
-        #value = int(input("To Delete: "))
-        try:
-            heap.delete_min()
-            print("Tree:\n", heap)
-        except ValueError:
+from binary_tree import BinaryTree, TreeNode
+import logging
+import tracing
+from argparse import ArgumentParser
+import random
+import heapq
+import os
+from snapshot import read_snapshot, write_snapshot
+log = logging.getLogger()
+
+SNAPSHOT_MAGIC = b'HEAP'
+
+class BinaryMinHeap(BinaryTree):
+    # Implicit heap, the keys live in a list in level order. The children of
+    # index i are at 2i + 1 and 2i + 2, and the parent is at (i - 1) // 2.
+    # Every occurrence of a key occupies a slot of its own. positions maps a
+    # key to its index, or to the set of its indices while it is in the heap
+    # more than once, so a key can be found and moved without scanning the heap
+    arity = 2
+    # Cost of one operation (bulk-load per key), checked by complexity.py.
+    # positions makes find O(1), and heapify builds in O(n)
+    complexity = {'insert': 'log n', 'find-hit': '1', 'find-miss': '1',
+                  'delete': 'log n', 'delete-min': 'log n',
+                  'bulk-load': '1', 'height': '1'}
+
+    def __init__(self, name):
+        BinaryTree.__init__(self, name)
+        self.items = []
+        self.positions = {}
+
+    def length(self):
+        return self.size
+
+    def height(self):
+        # A complete tree with n nodes has floor(log2(n)) + 1 levels
+        return len(self.items).bit_length()
+
+    def _add_position(self, value, index):
+        positions = self.positions
+        where = positions.get(value)
+        if where is None:
+            positions[value] = index
+        elif type(where) is int:
+            positions[value] = {where, index}
+        else:
+            where.add(index)
+
+    def _drop_position(self, value, index):
+        positions = self.positions
+        where = positions[value]
+        if type(where) is int:
+            del positions[value]
+        else:
+            where.discard(index)
+            if len(where) == 1:
+                positions[value] = where.pop()
+
+    # A key moved from slot old to slot new. Keys in the heap once are the
+    # common case, they only need the dict store
+    def _move(self, value, old, new):
+        positions = self.positions
+        where = positions[value]
+        if type(where) is int:
+            positions[value] = new
+        else:
+            where.discard(old)
+            where.add(new)
+
+    # Builds a detached TreeNode for the key at index, with its neighbours
+    # filled in, so callers can inspect it like a node of the linked heap
+    def _node_at(self, index):
+        items = self.items
+        node = TreeNode(items[index])
+        left = 2 * index + 1
+        if left < len(items):
+            node.left = TreeNode(items[left])
+        if left + 1 < len(items):
+            node.right = TreeNode(items[left + 1])
+        if index:
+            node.parent = TreeNode(items[(index - 1) // 2])
+        return node
+
+    # Sift the key at index up until its parent is not larger, returns the
+    # index it ends up at
+    def _heapify(self, index):
+        items = self.items
+        positions = self.positions
+        move = self._move
+        start = index
+        value = items[index]
+        while index:
+            parent = (index - 1) // 2
+            moved = items[parent]
+            if not value < moved:
+                break
+            items[index] = moved
+            if type(positions[moved]) is int:
+                positions[moved] = index
+            else:
+                move(moved, parent, index)
+            index = parent
+        if index != start:
+            items[index] = value
+            if type(positions[value]) is int:
+                positions[value] = index
+            else:
+                move(value, start, index)
+        return index
+
+    # Sift the key at index down until both children are not smaller,
+    # returns the index it ends up at
+    def _heapify_down(self, index):
+        items = self.items
+        positions = self.positions
+        move = self._move
+        size = len(items)
+        start = index
+        value = items[index]
+        child = 2 * index + 1
+        while child < size:
+            if child + 1 < size and items[child + 1] < items[child]:
+                child += 1
+            moved = items[child]
+            if not moved < value:
+                break
+            items[index] = moved
+            if type(positions[moved]) is int:
+                positions[moved] = index
+            else:
+                move(moved, child, index)
+            index = child
+            child = 2 * index + 1
+        if index != start:
+            items[index] = value
+            if type(positions[value]) is int:
+                positions[value] = index
+            else:
+                move(value, start, index)
+        return index
+
+    def insert(self, value):
+        if tracing.enabled:
+            log.debug("Inserting value {} into Binary Heap {}".format(
+                value, self.name))
+        if isinstance(value, TreeNode):
+            value = value.value
+        self.size += 1
+        self.key_snapshot = None
+        index = len(self.items)
+        self.items.append(value)
+        if value in self.positions:
+            self._add_position(value, index)
+        else:
+            self.positions[value] = index
+        self._heapify(index)
+
+    # Build a heap from keys in O(n) with Floyd's method, the keys are put in
+    # the list as they come and every internal node is sifted down, starting
+    # from the last one. Keys already in the heap are rebuilt along with them
+    def heapify(self, keys):
+        items = self.items
+        positions = self.positions
+        add_position = self._add_position
+        for key in keys:
+            if isinstance(key, TreeNode):
+                key = key.value
+            index = positions.setdefault(key, len(items))
+            if index != len(items):
+                add_position(key, len(items))
+            items.append(key)
+            self.size += 1
+        self.key_snapshot = None
+
+        for index in range((len(items) - 2) // self.arity, -1, -1):
+            self._heapify_down(index)
+
+    @classmethod
+    def from_iterable(cls, name, keys, **kwargs):
+        heap = cls(name, **kwargs)
+        heap.heapify(keys)
+        return heap
+
+    # Insert all keys, a batch at least as large as the heap is cheaper to
+    # build bottom-up together with the keys already in the heap
+    def insert_many(self, keys):
+        keys = list(keys)
+        if len(keys) >= self.size:
+            self.heapify(keys)
+        else:
+            for key in keys:
+                self.insert(key)
+        return len(keys)
+
+    # Insert the keys of an iterable of batches. An empty heap takes all of
+    # them in one bottom-up build, the keys go straight into its list
+    def insert_batches(self, batches):
+        if self.items:
+            return BinaryTree.insert_batches(self, batches)
+        size = self.size
+        self.heapify(key for batch in batches for key in batch)
+        return self.size - size
+
+    # Write the heap to a binary snapshot (see snapshot.py): the slots in list
+    # order and the arity
+    def save(self, path):
+        write_snapshot(path, SNAPSHOT_MAGIC, [
+            (self.items, len(self.items)),
+            ([self.arity], 1),
+        ])
+
+    # Rebuild a heap from a snapshot in O(n), the slots are taken over as they
+    # are, without sifting
+    @classmethod
+    def load(cls, path, name=None):
+        sections = read_snapshot(path, SNAPSHOT_MAGIC)
+        if len(sections) == 4:
+            # Written while duplicates shared a slot, with the keys stored
+            # more than once and their counts in between
+            items, keys, counts, (arity,) = sections
+        elif len(sections) == 2:
+            items, (arity,) = sections
+            keys = counts = []
+        else:
+            raise ValueError("Snapshot {} is not a heap".format(path))
+        heap = cls(name or os.path.basename(path))
+        if arity != heap.arity:
+            if not isinstance(heap, DaryMinHeap):
+                raise ValueError("Snapshot {} holds a heap with {} children per node".format(
+                    path, arity))
+            heap.arity = arity
+        heap.items = items.tolist()
+        for index, key in enumerate(heap.items):
+            heap._add_position(key, index)
+        heap.size = len(heap.items)
+        for key, count in zip(keys, counts):
+            for _ in range(count - 1):
+                heap.insert(key)
+        return heap
+
+    # The index of one occurrence of value
+    def _find_index(self, value):
+        try:
+            where = self.positions[value]
+        except KeyError:
+            if tracing.enabled:
+                log.debug("Value {} not found in heap {}".format(value, self.name))
+            raise ValueError
+        if type(where) is int:
+            return where
+        return next(iter(where))
+
+    def find(self, node):
+        if tracing.enabled:
+            log.debug("Finding value {} in Binary Heap {}".format(node, self.name))
+        if isinstance(node, TreeNode):
+            node = node.value
+        return self._node_at(self._find_index(node))
+
+    def _find_min(self):
+        if tracing.enabled:
+            log.debug("Finding min element in heap {}".format(self.name))
+        if not self.items:
+            return None
+        return self._node_at(0)
+
+    # Remove the key at index by moving the last key into its slot. The moved
+    # key can be smaller than the new parent as well, so sift both ways
+    def _delete_at(self, index):
+        items = self.items
+        value = items[index]
+        self._drop_position(value, index)
+        last = items.pop()
+        if index < len(items):
+            items[index] = last
+            self._move(last, len(items), index)
+            self._heapify(self._heapify_down(index))
+        return value
+
+    def _remove_one(self, index):
+        value = self._delete_at(index)
+        self.size -= 1
+        self.key_snapshot = None
+        return value
+
+    def delete(self, node):
+        if tracing.enabled:
+            log.debug("Deleting node {} in Heap {}".format(node, self.name))
+        if isinstance(node, TreeNode):
+            node = node.value
+        self._remove_one(self._find_index(node))
+
+    def delete_min(self):
+        if tracing.enabled:
+            log.debug("ExtractMin for heap {}".format(self.name))
+        if not self.items:
+            raise ValueError
+        return TreeNode(self._remove_one(0))
+
+    # Take one occurrence of the minimum out and put value in, with a single
+    # sift. The size of the heap does not change
+    def _replace_min(self, value):
+        self.key_snapshot = None
+        items = self.items
+        smallest = items[0]
+        self._drop_position(smallest, 0)
+        items[0] = value
+        self._add_position(value, 0)
+        self._heapify_down(0)
+        return smallest
+
+    # Insert value and then delete the minimum. When value is not larger than
+    # the minimum it comes straight back and the heap is left alone
+    def pushpop(self, value):
+        if isinstance(value, TreeNode):
+            value = value.value
+        if not self.items or not self.items[0] < value:
+            return value
+        return self._replace_min(value)
+
+    # Delete the minimum and then insert value, the minimum is returned even
+    # if value is smaller
+    def replace(self, value):
+        if isinstance(value, TreeNode):
+            value = value.value
+        if not self.items:
+            raise ValueError
+        return self._replace_min(value)
+
+    # Delete the k smallest keys, returned in ascending order
+    def pop_n(self, k):
+        keys = []
+        while len(keys) < k and self.items:
+            keys.append(self._remove_one(0))
+        return keys
+
+    # The k smallest keys in ascending order, without changing the heap. Only
+    # the children of keys already taken can be next, so a small side heap of
+    # candidate slots is enough, O(k log k)
+    def nsmallest(self, k):
+        items = self.items
+        keys = []
+        candidates = [(items[0], 0)] if items and k > 0 else []
+        while candidates:
+            value, index = heapq.heappop(candidates)
+            keys.append(value)
+            if len(keys) >= k:
+                break
+            first = self.arity * index + 1
+            for child in range(first, min(first + self.arity, len(items))):
+                heapq.heappush(candidates, (items[child], child))
+        return keys
+
+    # Replace one occurrence of value by new_value in O(log n)
+    def _change_key(self, value, new_value):
+        index = self._find_index(value)
+        if value == new_value:
+            return
+        self._drop_position(value, index)
+        self.items[index] = new_value
+        self._add_position(new_value, index)
+        self.key_snapshot = None
+        if new_value < value:
+            self._heapify(index)
+        else:
+            self._heapify_down(index)
+
+    def decrease_key(self, value, new_value):
+        if tracing.enabled:
+            log.debug("Decreasing key {} to {} in Heap {}".format(
+                value, new_value, self.name))
+        if new_value > value:
+            raise ValueError("New key {} is larger than {}".format(
+                new_value, value))
+        self._change_key(value, new_value)
+
+    def increase_key(self, value, new_value):
+        if tracing.enabled:
+            log.debug("Increasing key {} to {} in Heap {}".format(
+                value, new_value, self.name))
+        if new_value < value:
+            raise ValueError("New key {} is smaller than {}".format(
+                new_value, value))
+        self._change_key(value, new_value)
+
+    def _snapshot_keys(self):
+        return self.items
+
+    def _dump_root(self):
+        return 0 if self.items else None
+
+    def _dump_node(self, index):
+        left = 2 * index + 1
+        size = len(self.items)
+        return (self.items[index],
+                left if left < size else None,
+                left + 1 if left + 1 < size else None)
+
+    # Keys in list order, i.e. level by level
+    def _dump_compact(self, fp, max_depth=None, max_nodes=None):
+        count = len(self.items)
+        if max_depth is not None:
+            # Slots in the levels 0 to max_depth
+            count = min(count, (self.arity ** (max_depth + 1) - 1) // (self.arity - 1))
+        if max_nodes is not None:
+            count = min(count, max_nodes)
+        for start in range(0, count, 4096):
+            chunk = self.items[start:min(start + 4096, count)]
+            fp.write('\n'.join(map(str, chunk)) + '\n')
+        return count, count < len(self.items)
+
+
+# BinaryMinHeap with d children per slot instead of two. The children of index
+# i are at d * i + 1 to d * i + d and the parent is at (i - 1) // d. The heap
+# is log2(d) times shallower, so inserts (sift up) get cheaper, and every
+# level of a sift down compares d children that sit next to each other
+class DaryMinHeap(BinaryMinHeap):
+    def __init__(self, name, d=4):
+        if d < 2:
+            raise ValueError("A heap needs at least 2 children per node")
+        BinaryMinHeap.__init__(self, name)
+        self.arity = d
+
+    def height(self):
+        levels = 0
+        capacity = 0
+        width = 1
+        while capacity < len(self.items):
+            capacity += width
+            width *= self.arity
+            levels += 1
+        return levels
+
+    # TreeNode only has room for two children, so a slot is shown in the
+    # binary form of a multiway tree: left is the first child and right is the
+    # next sibling. dump() draws the heap the same way
+    def _node_at(self, index):
+        items = self.items
+        value, left, right = self._dump_node(index)
+        node = TreeNode(value)
+        if left is not None:
+            node.left = TreeNode(items[left])
+        if right is not None:
+            node.right = TreeNode(items[right])
+        if index:
+            node.parent = TreeNode(items[(index - 1) // self.arity])
+        return node
+
+    def _dump_node(self, index):
+        size = len(self.items)
+        first = self.arity * index + 1
+        sibling = index + 1
+        if not index or index % self.arity == 0:
+            # Last child of its parent, or the root
+            sibling = size
+        return (self.items[index],
+                first if first < size else None,
+                sibling if sibling < size else None)
+
+    def _heapify(self, index):
+        items = self.items
+        positions = self.positions
+        move = self._move
+        d = self.arity
+        start = index
+        value = items[index]
+        while index:
+            parent = (index - 1) // d
+            moved = items[parent]
+            if not value < moved:
+                break
+            items[index] = moved
+            if type(positions[moved]) is int:
+                positions[moved] = index
+            else:
+                move(moved, parent, index)
+            index = parent
+        if index != start:
+            items[index] = value
+            if type(positions[value]) is int:
+                positions[value] = index
+            else:
+                move(value, start, index)
+        return index
+
+    def _heapify_down(self, index):
+        items = self.items
+        positions = self.positions
+        move = self._move
+        d = self.arity
+        size = len(items)
+        start = index
+        value = items[index]
+        first = d * index + 1
+        while first < size:
+            # Smallest of the (up to) d children
+            child = first
+            moved = items[first]
+            for other in range(first + 1, min(first + d, size)):
+                if items[other] < moved:
+                    child = other
+                    moved = items[other]
+            if not moved < value:
+                break
+            items[index] = moved
+            if type(positions[moved]) is int:
+                positions[moved] = index
+            else:
+                move(moved, child, index)
+            index = child
+            first = d * index + 1
+        if index != start:
+            items[index] = value
+            if type(positions[value]) is int:
+                positions[value] = index
+            else:
+                move(value, start, index)
+        return index
+
+
+# The original heap built from linked TreeNodes, kept to compare against the
+# array backed BinaryMinHeap
+class LinkedBinaryMinHeap(BinaryTree):
+    # What a binary heap promises. Finding the last node is a breadth first
+    # walk, so insert and delete-min don't keep it and complexity.py says so
+    complexity = {'insert': 'log n', 'find-hit': 'n', 'find-miss': 'n',
+                  'delete': 'n', 'delete-min': 'log n',
+                  'bulk-load': 'log n', 'height': 'n'}
+
+    def __init__(self, name):
+        BinaryTree.__init__(self, name)
+
+    def _heapify(self, root):
+        while root and root.parent:
+            if root < root.parent:
+                # Swap
+                (root.parent.value, root.value) = (
+                    root.value, root.parent.value)
+            root = root.parent
+
+    def _insert(self, root, node):
+        if not root:
+            return node
+
+        queue = list([root])
+
+        while len(queue):
+            cur = queue.pop(0)
+            # Insert node in first open position while doing a BFS
+            if not cur.left:
+                if tracing.enabled:
+                    log.debug("Found empty position at left of node {}".format(cur))
+                cur.left = node
+                node.parent = cur
+                break
+            elif not cur.right:
+                if tracing.enabled:
+                    log.debug("Found empty position at right of node {}".format(cur))
+                cur.right = node
+                node.parent = cur
+                break
+            else:
+                queue.append(cur.left)
+                queue.append(cur.right)
+
+        if tracing.enabled:
+            log.debug("Heapifying from node {}".format(node))
+        self._heapify(node)
+        self.size += 1
+        self.key_snapshot = None
+
+    def insert(self, value):
+        if tracing.enabled:
+            log.debug("Inserting value {} into Binary Heap {}".format(
+                value, self.name))
+        if type(value) == int:
+            value = TreeNode(value)
+        if not self.root:
+            self.root = value
+            self.size += 1
+            self.key_snapshot = None
+            return
+        self._insert(self.root, value)
+
+    def find(self, node):
+        if tracing.enabled:
+            log.debug("Finding value {} into Binary Heap {}".format(node, self.name))
+        if type(node) == int:
+            node = TreeNode(node)
+        if not self.root:
+            raise ValueError
+
+        # Entire tree needs to be searched, try a BFS to find it
+        queue = list([self.root])
+        while len(queue):
+            cur = queue.pop(0)
+            if cur == node:
+                if tracing.enabled:
+                    log.debug("Value found!")
+                return cur
+            if cur.left:
+                queue.append(cur.left)
+            if cur.right:
+                queue.append(cur.right)
+        raise ValueError
+
+    def _find_min(self):
+        if tracing.enabled:
+            log.debug("Finding min element in heap {}".format(self.name))
+        return self.root
+
+    def _find_last(self):
+        # To find the last element, do a BFS. The last element popped from the queue is the last element in the heap
+        if not self.root:
+            return None
+
+        queue = list([self.root])
+        last = None
+        while len(queue):
+            last = queue.pop(0)
+            if last.left:
+                queue.append(last.left)
+            if last.right:
+                queue.append(last.right)
+
+        if tracing.enabled:
+            log.debug("The last element is {}".format(last))
+        return last
+
+    def delete(self, node):
+        if tracing.enabled:
+            log.debug("Deleting node {} in Heap {}".format(node, self.name))
+        if type(node) == int:
+            node = TreeNode(node)
+
+        found = self.find(node)
+        last = self._find_last()
+        (found.value, last.value) = (last.value, found.value)
+
+        if not last.parent:
+            # Root is the only element
+            if tracing.enabled:
+                log.debug("Deleting the root element")
+            del last
+            self.root = None
+            self.size -= 1
+            self.key_snapshot = None
+            return
+
+        # Reset pointers of last
+        if last == last.parent.left:
+            if tracing.enabled:
+                log.debug("The last node is it's parent's left child")
+            last.parent.left = None
+        else:
+            if tracing.enabled:
+                log.debug("The last node is it's parent's right child")
+            last.parent.right = None
+        del last
+        self.size -= 1
+        self.key_snapshot = None
+        if not found.parent:
+            self.root = found
+        self._heapify_down(found)
+
+    def _heapify_down(self, node):
+        cur = node
+        while cur and (cur.left or cur.right):
+            if cur == min(cur, cur.left, cur.right):
+                break
+
+            if not cur.right:
+                # Only left exists
+                (cur.value, cur.left.value) = (cur.left.value, cur.value)
+                cur = cur.left
+            elif not cur.left:
+                # Only right exists
+                (cur.value, cur.right.value) = (cur.right.value, cur.value)
+                cur = cur.right
+            else:
+                if cur.left < cur.right:
+                    (cur.value, cur.left.value) = (cur.left.value, cur.value)
+                    cur = cur.left
+                else:
+                    (cur.value, cur.right.value) = (cur.right.value, cur.value)
+                    cur = cur.right
+    
+    def delete_min(self):
+        if tracing.enabled:
+            log.debug("ExtractMin for heap {}".format(self.name))
+        if not self.root:
+            raise ValueError
+        node = TreeNode(self._find_min().value)
+        self.delete(node)
+        return node
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+    tracing.set_trace(numLogLevel <= logging.DEBUG)
+
+    heap = BinaryMinHeap("Test")
+    for _ in range(10):
+        heap.insert(TreeNode(random.randint(-100, 100)))
+        print(heap)
+    """
+    for i in range(2):
+        value = int(input("To Find: "))
+        try:
+            heap.find(TreeNode(value))
+            print("Tree:\n", heap)
+        except ValueError:
+            print("Not Found!")
+    """
+
+    for i in range(4):
+        #value = int(input("To Delete: "))
+        try:
+            heap.delete_min()
+            print("Tree:\n", heap)
+        except ValueError:
             print("Not Found!")
\ No newline at end of file
@@ -1,11 +1,22 @@
 import logging
+import tracing
 from argparse import ArgumentParser
 import random
+import io
+from bisect import bisect_left
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 log = logging.getLogger()
 
 
 class TreeNode(object):
+    # No per-instance __dict__, the trees hold millions of these
+    __slots__ = ('left', 'right', 'value', 'parent')
+
     def __init__(self, value):
         self.left = None
         self.right = None
@@ -32,14 +43,16 @@ class TreeNode(object):
 
         return self.value > other.value
 
+    # Count the levels one at a time, a degenerate tree is as deep as it is
+    # large and would hit the recursion limit otherwise
     def height(self):
-        left = 0
-        right = 0
-        if self.left:
-            left = self.left.height()
-        if self.right:
-            right = self.right.height()
-        return 1 + max(left, right)
+        height = 0
+        level = [self]
+        while level:
+            height += 1
+            level = [child for node in level
+                     for child in (node.left, node.right) if child]
+        return height
 
 
 class BinaryTree(object):
@@ -48,6 +61,8 @@ class BinaryTree(object):
         self.num_nodes = 0
         self.name = name
         self.size = 0
+        # Sorted copy of the keys for find_many, every mutation drops it
+        self.key_snapshot = None
 
     def length(self):
         return self.size
@@ -57,59 +72,125 @@ class BinaryTree(object):
             return self.root.height()
         return 0
 
-    # Prints the tree on it's side, with the indent set to the level of the node
-    # Siblings are on the same level
-    # Sample output:
-    """
-    Tree:
-    17
-    - None
-    - 62
-    - - None
-    - - 89
-    - - - -20
-    - - - - None
-    - - - - 68
-    - - - - - None
-    - - - - - 70
-    - - - - - - -37
-    - - - - - - - -84
-    - - - - - - - - None
-    - - - - - - - - -38
-    - - - - - - - - - -72
-    - - - - - - - - - None
-    - - - - - - - None
-    - - - - - - None
-    - - - None
-    """
-    def _pretty_print(self, node, level=0):
-        # log.debug("Entered print at node {} at level {}".format(node, level))
-        result = ''
-
-        for _ in range(level):
-            result += '__'  # Add 2 spaces for each level
-        result += '(' + str(node) + ")\n"
-        # log.debug("Result at level {} is {}".format(level, result))
-        if not node:
-            return result
-        if not node.left and not node.right:
-            return result
+    # Hooks for dump(), a node handle is whatever the engine uses to address a
+    # node (the node itself here), and None stands for a missing child
+    def _dump_root(self):
+        return self.root
 
-        result += self._pretty_print(node.left, level+1)
-        result += self._pretty_print(node.right, level+1)
+    # The key of the node and the handles of its children
+    def _dump_node(self, node):
+        return node.value, node.left, node.right
 
-        return result
+    # Writes the tree on it's side to fp, with the indent set to the level of
+    # the node. Siblings are on the same level, and a missing child is shown as
+    # None when the other child exists. Sample output:
+    """
+    (17)
+    __(-20)
+    ____(-84)
+    ____(None)
+    __(62)
+    ____(None)
+    ____(89)
+    """
+    # The nodes are visited in pre-order with an explicit stack and the lines
+    # are written in batches, so the time is linear in the size of the output
+    # and the memory is bounded by the height of the tree. Levels below
+    # max_depth and nodes after the first max_nodes are left out and marked
+    # with (...). The compact format writes one key per line instead, in an
+    # order from which the engine can be rebuilt. Returns the number of keys
+    # written and whether any were left out
+    def dump(self, fp, max_depth=None, max_nodes=None, compact=False):
+        if compact:
+            return self._dump_compact(fp, max_depth, max_nodes)
+
+        dump_node = self._dump_node
+        if max_depth is None:
+            max_depth = -1
+        if max_nodes is None:
+            max_nodes = -1
+        indents = ['']
+        lines = []
+        written = 0
+        truncated = False
+        stack = [(self._dump_root(), 0)]
+        while stack:
+            node, level = stack.pop()
+            if level >= len(indents):
+                indents.append(indents[-1] + '__')
+            if node is None:
+                lines.append(indents[level] + '(None)\n')
+                continue
+            if written == max_nodes:
+                lines.append(indents[level] + '(...)\n')
+                truncated = True
+                break
+            value, left, right = dump_node(node)
+            lines.append('%s(%s)\n' % (indents[level], value))
+            written += 1
+            if len(lines) >= 4096:
+                fp.write(''.join(lines))
+                lines = []
+
+            if left is None and right is None:
+                continue
+            if level == max_depth:
+                lines.append(indents[level] + '__(...)\n')
+                truncated = True
+                continue
+            stack.append((right, level + 1))
+            stack.append((left, level + 1))
+        fp.write(''.join(lines))
+        return written, truncated
+
+    # Pre-order keys, which is enough to rebuild a search tree
+    def _dump_compact(self, fp, max_depth=None, max_nodes=None):
+        dump_node = self._dump_node
+        if max_depth is None:
+            max_depth = -1
+        if max_nodes is None:
+            max_nodes = -1
+        lines = []
+        written = 0
+        truncated = False
+        root = self._dump_root()
+        stack = [(root, 0)] if root is not None else []
+        while stack and written != max_nodes:
+            node, level = stack.pop()
+            value, left, right = dump_node(node)
+            lines.append(value)
+            written += 1
+            if len(lines) >= 4096:
+                fp.write('\n'.join(map(str, lines)) + '\n')
+                lines = []
+            if level == max_depth:
+                truncated = truncated or left is not None or right is not None
+                continue
+            if right is not None:
+                stack.append((right, level + 1))
+            if left is not None:
+                stack.append((left, level + 1))
+        if lines:
+            fp.write('\n'.join(map(str, lines)) + '\n')
+        return written, truncated or bool(stack)
 
     def __str__(self):
         # Display the tree as a string
-        return self._pretty_print(self.root)
-    
+        buffer = io.StringIO()
+        self.dump(buffer)
+        return buffer.getvalue()
+
     def _delete_nodes(self, node):
-        if not node:
-            return
-        self._delete_nodes(node.left)
-        self._delete_nodes(node.right)
-        del node
+        # Unlink every node so that the parent pointer cycles don't keep the
+        # nodes alive until the garbage collector runs
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
+            if node.left:
+                stack.append(node.left)
+            if node.right:
+                stack.append(node.right)
+            node.left = node.right = node.parent = None
     
     def __del__(self):
         # Delete each node recursively
@@ -122,32 +203,143 @@ class BinaryTree(object):
         return self.num_nodes
 
     def insert(self, node):
-        log.debug("Inserting node {} into tree {}".format(node, self.name))
+        if tracing.enabled:
+            log.debug("Inserting node {} into tree {}".format(node, self.name))
         cur = self.root
         while cur and (cur.left or cur.right):
             if node < cur and cur.left:
-                log.debug("Going left from node {}".format(cur))
+                if tracing.enabled:
+                    log.debug("Going left from node {}".format(cur))
                 cur = cur.left
             elif cur.right:
-                log.debug("Going right from node {}".format(cur))
+                if tracing.enabled:
+                    log.debug("Going right from node {}".format(cur))
                 cur = cur.right
             else:
-                log.debug("Breaking!")
+                if tracing.enabled:
+                    log.debug("Breaking!")
                 break
 
         if not cur:
-            log.debug("The first node is being inserted")
+            if tracing.enabled:
+                log.debug("The first node is being inserted")
             self.root = node
         else:
-            log.debug("Inserting value {} at {}".format(node, cur))
+            if tracing.enabled:
+                log.debug("Inserting value {} at {}".format(node, cur))
             if node < cur:
                 cur.left = node
             else:
                 cur.right = node
             node.parent = cur
-            log.debug("After insertion, cur = {}, left = {}, right = {}".format(
-                cur, cur.left, cur.right))
+            if tracing.enabled:
+                log.debug("After insertion, cur = {}, left = {}, right = {}".format(
+                    cur, cur.left, cur.right))
         self.size += 1
+        self.key_snapshot = None
+
+    # Insert all keys, returns the number of keys inserted
+    def insert_many(self, keys):
+        count = 0
+        for key in keys:
+            self.insert(key)
+            count += 1
+        return count
+
+    # Insert the keys of an iterable of batches, one insert_many per batch.
+    # Returns the number of keys inserted
+    def insert_batches(self, batches):
+        count = 0
+        for batch in batches:
+            count += self.insert_many(batch)
+        return count
+
+    # Delete one occurrence of every key, returns the number of keys that were
+    # deleted and the number of keys that were not in the tree
+    def delete_many(self, keys):
+        deleted = 0
+        missing = 0
+        for key in keys:
+            try:
+                self.delete(key)
+                deleted += 1
+            except ValueError:
+                missing += 1
+        return deleted, missing
+
+    # Operation counters, see counters.py. Enabling them swaps the class of
+    # the engine for a counting subclass, so a tree without them runs the
+    # plain code
+    def enable_stats(self):
+        from counters import OperationCounters, counted_class
+        if not hasattr(self, 'counters'):
+            self.counters = OperationCounters()
+        self.__class__ = counted_class(type(self))
+
+    def disable_stats(self):
+        self.__class__ = getattr(type(self), 'base', type(self))
+
+    def stats_enabled(self):
+        return hasattr(type(self), 'base')
+
+    # The counts so far, they are kept when the counters are disabled
+    def stats(self):
+        if not hasattr(self, 'counters'):
+            return {}
+        return self.counters.snapshot()
+
+    def reset_stats(self):
+        if hasattr(self, 'counters'):
+            self.counters.reset()
+
+    # Every key of the engine once, in any order. Walks the dump hooks, so it
+    # works for every engine, the ones that can do it cheaper override it
+    def _snapshot_keys(self):
+        keys = []
+        stack = []
+        handle = self._dump_root()
+        if handle is not None:
+            stack.append(handle)
+        while stack:
+            value, left, right = self._dump_node(stack.pop())
+            keys.append(value)
+            if right is not None:
+                stack.append(right)
+            if left is not None:
+                stack.append(left)
+        return keys
+
+    def _key_snapshot(self):
+        if self.key_snapshot is None:
+            keys = self._snapshot_keys()
+            if numpy is not None:
+                self.key_snapshot = numpy.sort(numpy.array(keys, dtype=numpy.int64))
+            else:
+                self.key_snapshot = sorted(keys)
+        return self.key_snapshot
+
+    # Membership of every key in keys, as a boolean mask. The keys are looked
+    # up with one vectorized binary search in a sorted snapshot of the engine,
+    # which is taken on the first call and kept until the engine changes.
+    # Without numpy the mask is a list and the search is a bisect per key
+    def contains_many(self, keys):
+        snapshot = self._key_snapshot()
+        if numpy is None:
+            found = []
+            for key in keys:
+                index = bisect_left(snapshot, key)
+                found.append(index < len(snapshot) and snapshot[index] == key)
+            return found
+
+        keys = numpy.asarray(keys, dtype=numpy.int64)
+        if not len(snapshot):
+            return numpy.zeros(len(keys), dtype=bool)
+        index = numpy.searchsorted(snapshot, keys)
+        numpy.minimum(index, len(snapshot) - 1, out=index)
+        return snapshot[index] == keys
+
+    def find_many(self, keys):
+        return self.contains_many(keys)
 
     def _find_min(self, startNode):
         cur = startNode
@@ -157,11 +349,12 @@ class BinaryTree(object):
 
     # Replace node u by the subtree rooted at v
     def _transplant(self, u, v):
-        log.debug(
-            "Transplanting node {} with subtree rooted at node {}".format(u, v))
+        if tracing.enabled:
+            log.debug(
+                "Transplanting node {} with subtree rooted at node {}".format(u, v))
         if not u.parent:
             self.root = v
-        elif u == u.parent.left:
+        elif u is u.parent.left:
             u.parent.left = v
         else:
             u.parent.right = v
@@ -169,7 +362,8 @@ class BinaryTree(object):
             v.parent = u.parent
 
     def _delete(self, node):
-        log.debug("Deleting node {}".format(node))
+        if tracing.enabled:
+            log.debug("Deleting node {}".format(node))
         if not node:
             raise ValueError("Invalid node specified for delete")
         if not node.left:
@@ -190,19 +384,23 @@ class BinaryTree(object):
             successor.left.parent = successor
         del node
         self.size -= 1
+        self.key_snapshot = None
 
     def delete(self, value):
-        log.debug("Finding value {} in tree {}".format(value, self.name))
+        if tracing.enabled:
+            log.debug("Finding value {} in tree {}".format(value, self.name))
         node = self.find(value)
         if not node:
             log.error("The value {} was not found in the tree {}".format(
                 value, self.name))
             return
-        log.debug("Found node {}, parent is {}".format(node, node.parent))
+        if tracing.enabled:
+            log.debug("Found node {}, parent is {}".format(node, node.parent))
         self._delete(node)
 
     def find(self, value):
-        log.debug("Finding value {} in tree {}".format(value, self.name))
+        if tracing.enabled:
+            log.debug("Finding value {} in tree {}".format(value, self.name))
         node = TreeNode(value)
         cur = self.root
         while cur and not node == cur:
@@ -212,10 +410,12 @@ class BinaryTree(object):
                 cur = cur.right
 
         if not cur or cur != node:
-            log.info("The value {} was not found".format(node))
+            if tracing.enabled:
+                log.debug("The value {} was not found".format(node))
             raise ValueError
-        log.info("Found value {} at node.parent = {}, left = {}, right = {}".format(
-            value, cur.parent, cur.left, cur.right))
+        if tracing.enabled:
+            log.debug("Found value {} at node.parent = {}, left = {}, right = {}".format(
+                value, cur.parent, cur.left, cur.right))
         return cur
 
 
@@ -231,6 +431,7 @@ if __name__ == '__main__':
     numLogLevel = getattr(logging, logLevel.upper())
     logging.basicConfig(level=numLogLevel)
     log.setLevel(numLogLevel)
+    tracing.set_trace(numLogLevel <= logging.DEBUG)
 
     tree = BinaryTree("Test")
     for i in range(10):
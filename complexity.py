@@ -0,0 +1,124 @@
+import json
+import logging
+import math
+import sys
+from argparse import ArgumentParser
+
+from engines import ENGINES, create_engine
+from tests import OPERATIONS, measure, percentile
+
+log = logging.getLogger()
+
+# Growth classes from the cheapest to the most expensive, with the largest
+# empirical exponent each one is reported for. The exponent is the slope of
+# log(time) against log(size): 0 for a constant cost, about 1 / ln n for
+# log n, 1 for n and about 1.1 for n log n between 1000 and 256000 keys.
+# Cache misses add to every exponent, up to 0.2 at these sizes, so the
+# boundary between n and n log n is coarse. Genuine log n operations measure
+# 0.06 to 0.31, anything between 0.35 and 0.8 grows like a power of n below
+# one and is reported as sqrt n
+CLASSES = [('1', 0.05), ('log n', 0.35), ('sqrt n', 0.8), ('n', 1.2),
+           ('n log n', None)]
+
+# Classes that are flagged against each other. Cache misses grow with the
+# size of the engine too, which makes a constant cost look like log n over
+# any useful range of sizes, so those two are not told apart when flagging
+TIER = {'1': 0, 'log n': 0, 'sqrt n': 1, 'n': 2, 'n log n': 3}
+
+
+# Least squares slope of log(times) against log(sizes)
+def exponent(sizes, times):
+    xs = [math.log(n) for n in sizes]
+    ys = [math.log(max(t, 1)) for t in times]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if not sxx:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sxx
+
+
+def classify(sizes, times):
+    slope = exponent(sizes, times)
+    for name, limit in CLASSES:
+        if limit is None or slope < limit:
+            return name, slope
+
+
+def check(engines, operations, sizes, distribution='uniform', samples=200,
+          seed=0):
+    rows = []
+    for engine in engines:
+        declared = getattr(create_engine(engine, "Declared"), 'complexity', {})
+        for operation in operations:
+            times = []
+            try:
+                for size in sizes:
+                    latencies = sorted(measure(engine, operation, size,
+                                               distribution, samples,
+                                               seed=seed))
+                    times.append(percentile(latencies, 50))
+            except NotImplementedError:
+                continue
+            fitted, slope = classify(sizes, times)
+            promised = declared.get(operation)
+            worse = promised is not None and TIER[fitted] > TIER[promised]
+            log.info("{:>12} {:>10} {}".format(engine, operation, times))
+            rows.append({
+                'engine': engine,
+                'operation': operation,
+                'sizes': sizes,
+                'p50_ns': times,
+                'declared': promised,
+                'fitted': fitted,
+                'exponent': slope,
+                'worse': worse,
+            })
+    return rows
+
+
+def print_report(rows):
+    print("{:>12} {:>10} {:>9} {:>9} {:>9}  {}".format(
+        "Engine", "Operation", "Declared", "Fitted", "Exponent", "Status"))
+    for row in rows:
+        status = 'WORSE' if row['worse'] else 'ok'
+        print("{:>12} {:>10} {:>9} {:>9} {:>9.2f}  {}".format(
+            row['engine'], row['operation'], row['declared'] or '-',
+            row['fitted'], row['exponent'], status))
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    # The linked heap is left out by default, filling it is quadratic
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES.keys()),
+                        default=['avltree', 'heap', 'pairingheap', 'pooledavl'])
+    parser.add_argument('--operations', nargs='+',
+                        choices=sorted(OPERATIONS.keys()),
+                        default=sorted(OPERATIONS.keys()))
+    parser.add_argument('--start', type=int, default=1000,
+                        help='smallest size')
+    parser.add_argument('--steps', type=int, default=5,
+                        help='number of sizes, each four times the previous one')
+    parser.add_argument('--samples', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the results as JSON')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "WARNING"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    sizes = [args.start * 4 ** i for i in range(args.steps)]
+    rows = check(args.engines, args.operations, sizes, samples=args.samples,
+                 seed=args.seed)
+    print_report(rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if any(row['worse'] for row in rows):
+        sys.exit(1)
@@ -0,0 +1,386 @@
+import logging
+import random
+import sys
+from argparse import ArgumentParser
+
+from binary_tree import BinaryTree, TreeNode
+from avl_tree import AvlTree
+from bin_heap import BinaryMinHeap
+
+# Operation counters for the engines. They are switched on per engine with
+# tree.enable_stats(), which swaps the class of the engine for a subclass
+# whose hot methods count before they hand over to the real ones, and
+# disable_stats() swaps the plain class back. An engine without counters
+# runs exactly the code it runs without this module, so they cost nothing
+# when they are off.
+#
+# The counting happens in a read-only pass that walks the same path as the
+# real descent or sift, while the engine has not changed yet, so the engine
+# code itself stays free of counters. The bulk rebuilds of AvlTree.insert_many
+# and delete_many are not counted, they build the tree from sorted keys
+# instead of comparing their way through it, and neither is the sort of their
+# batch. python counters.py checks the counted comparisons against the ones
+# the engines really make, so the read-only passes can't drift from them
+
+log = logging.getLogger()
+
+ROTATIONS = ('zig-zig', 'zag-zag', 'zig-zag', 'zag-zig')
+
+
+class OperationCounters(object):
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Key comparisons, what TreeNode.__lt__, __gt__ and __eq__ (or the
+        # same comparison on the plain keys) would be called for
+        self.comparisons = 0
+        self.node_visits = 0
+        # Keys moved one level by a sift
+        self.swaps = 0
+        self.rotations = dict((case, 0) for case in ROTATIONS)
+
+    def snapshot(self):
+        stats = {
+            'comparisons': self.comparisons,
+            'node_visits': self.node_visits,
+            'swaps': self.swaps,
+        }
+        for case in ROTATIONS:
+            stats['rotations.' + case] = self.rotations[case]
+        return stats
+
+
+# Searches shared by the plain and the AVL tree, mirrors BinaryTree.find and
+# the walk down the left spine to the smallest key of a subtree
+class CountingSearchTree(object):
+    # Returns whether value was found
+    def _count_find(self, value):
+        counters = self.counters
+        cur = self.root
+        while cur:
+            counters.node_visits += 1
+            counters.comparisons += 1
+            if cur.value == value:
+                return True
+            counters.comparisons += 1
+            if value < cur.value:
+                cur = cur.left
+            else:
+                cur = cur.right
+        return False
+
+    def find(self, value):
+        if self._count_find(value.value if isinstance(value, TreeNode) else value):
+            # find compares the node it stopped at once more
+            self.counters.comparisons += 1
+        return super(CountingSearchTree, self).find(value)
+
+    def _find_min(self, startNode):
+        counters = self.counters
+        cur = startNode
+        while cur:
+            counters.node_visits += 1
+            cur = cur.left
+        return super(CountingSearchTree, self)._find_min(startNode)
+
+
+# Plain binary search tree, mirrors BinaryTree.insert and _delete
+class CountingBinaryTree(CountingSearchTree):
+    def insert(self, node):
+        counters = self.counters
+        cur = self.root
+        while cur:
+            counters.node_visits += 1
+            if not (cur.left or cur.right):
+                break
+            counters.comparisons += 1
+            if node < cur and cur.left:
+                cur = cur.left
+            elif cur.right:
+                cur = cur.right
+            else:
+                break
+        if cur:
+            counters.comparisons += 1
+        return super(CountingBinaryTree, self).insert(node)
+
+    def _delete(self, node):
+        if node and node.left and node.right:
+            # The successor's parent is compared with the node by key
+            self.counters.comparisons += 1
+        return super(CountingBinaryTree, self)._delete(node)
+
+
+# AVL tree, mirrors the iterative insert and delete, which insert, delete and
+# the per-key path of insert_many and delete_many all go through, and counts
+# the rotations by the case _rebalance picks. delete_min is counted by the
+# walk of _find_min
+class CountingAvlTree(CountingSearchTree):
+    def _insert_iterative(self, node):
+        counters = self.counters
+        value = node.value
+        cur = self.root
+        while cur:
+            counters.node_visits += 1
+            counters.comparisons += 1
+            if value < cur.value:
+                cur = cur.left
+            else:
+                cur = cur.right
+        if self.root:
+            # The side of the parent the node is attached to
+            counters.comparisons += 1
+        return super(CountingAvlTree, self)._insert_iterative(node)
+
+    def _delete_iterative(self, value):
+        self._count_find(value)
+        return super(CountingAvlTree, self)._delete_iterative(value)
+
+    def _rebalance(self, root):
+        balance = root.height_difference()
+        if balance < -1:
+            case = 'zig-zig' if root.left.height_difference() <= 0 else 'zig-zag'
+            self.counters.rotations[case] += 1
+        elif balance > 1:
+            case = 'zag-zag' if root.right.height_difference() >= 0 else 'zag-zig'
+            self.counters.rotations[case] += 1
+        return super(CountingAvlTree, self)._rebalance(root)
+
+
+# Array heaps of any arity, mirrors the sifts of BinaryMinHeap and DaryMinHeap
+class CountingMinHeap(object):
+    def _find_index(self, value):
+        self.counters.node_visits += 1
+        return super(CountingMinHeap, self)._find_index(value)
+
+    def _heapify(self, index):
+        counters = self.counters
+        items = self.items
+        d = self.arity
+        value = items[index]
+        start = index
+        while index:
+            parent = (index - 1) // d
+            counters.node_visits += 1
+            counters.comparisons += 1
+            if not value < items[parent]:
+                break
+            counters.swaps += 1
+            index = parent
+        return super(CountingMinHeap, self)._heapify(start)
+
+    def _heapify_down(self, index):
+        counters = self.counters
+        items = self.items
+        d = self.arity
+        size = len(items)
+        value = items[index]
+        start = index
+        first = d * index + 1
+        while first < size:
+            last = min(first + d, size)
+            counters.node_visits += last - first
+            counters.comparisons += last - first
+            child = first
+            for other in range(first + 1, last):
+                if items[other] < items[child]:
+                    child = other
+            if not items[child] < value:
+                break
+            counters.swaps += 1
+            index = child
+            first = d * index + 1
+        return super(CountingMinHeap, self)._heapify_down(start)
+
+
+_MIXINS = [
+    (AvlTree, CountingAvlTree),
+    (BinaryMinHeap, CountingMinHeap),
+]
+_counted = {}
+
+
+def counted_class(cls):
+    if cls not in _counted:
+        mixin = None
+        if cls is BinaryTree:
+            mixin = CountingBinaryTree
+        for engine, candidate in _MIXINS:
+            if issubclass(cls, engine):
+                mixin = candidate
+                break
+        if mixin is None:
+            raise ValueError("There are no counters for {}".format(cls.__name__))
+        counted = type('Counted' + cls.__name__, (mixin, cls), {'base': cls})
+        _counted[cls] = counted
+        _counted[counted] = counted
+    return _counted[cls]
+
+
+# Key that counts every comparison made with it, to check the counters
+# against the comparisons an engine really makes
+class ComparedKey(object):
+    __slots__ = ('key',)
+    calls = 0
+
+    def __init__(self, key):
+        self.key = key
+
+    def __repr__(self):
+        return str(self.key)
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __lt__(self, other):
+        ComparedKey.calls += 1
+        return self.key < other.key
+
+    def __gt__(self, other):
+        ComparedKey.calls += 1
+        return self.key > other.key
+
+    def __le__(self, other):
+        ComparedKey.calls += 1
+        return self.key <= other.key
+
+    def __ge__(self, other):
+        ComparedKey.calls += 1
+        return self.key >= other.key
+
+    def __eq__(self, other):
+        ComparedKey.calls += 1
+        return self.key == other.key
+
+    def __ne__(self, other):
+        ComparedKey.calls += 1
+        return self.key != other.key
+
+
+# Runs every counted operation with ComparedKey keys on two copies of an
+# engine, one counting and one plain, and returns (operation, counted, made)
+# for each one where the counters of the first are off from the comparisons
+# the second makes. The plain copy is needed because the counting one makes
+# every comparison twice, once in the read-only pass. AvlTree.insert_many and
+# delete_many sort their batch first, that isn't counted, like the bulk
+# rebuilds. Keys are unique, the heaps would compare equal keys in their
+# position dict
+def check(create, size=500, rounds=20, seed=0):
+    from avl_tree import AvlTreeNode
+
+    # Batches of 5 keys into smaller trees take the uncounted rebuild path
+    if size < 100:
+        raise ValueError("The check needs at least 100 keys")
+    # A round takes up to 7 keys out and puts 6 in, keep half the keys
+    rounds = min(rounds, size // 14)
+    rng = random.Random(seed)
+    values = rng.sample(range(10 * size), 2 * size)
+    keys = [ComparedKey(value) for value in values[:size]]
+    spare = [ComparedKey(value) for value in values[size:]]
+    plain = create()
+    counted = create()
+    heap = isinstance(plain, BinaryMinHeap)
+    # The engines take their keys in different forms
+    if heap:
+        wrap = unwrap = lambda key: key
+    elif isinstance(plain, AvlTree):
+        wrap = unwrap = AvlTreeNode
+    else:
+        wrap = TreeNode
+        unwrap = lambda key: key
+
+    def sort_calls(batch):
+        calls = ComparedKey.calls
+        sorted(batch)
+        return ComparedKey.calls - calls
+
+    # Each operation returns its argument and how to apply it to an engine
+    def insert():
+        return spare.pop(), lambda engine, key: engine.insert(wrap(key))
+
+    def find_hit():
+        return rng.choice(keys), lambda engine, key: engine.find(key)
+
+    def find_miss():
+        return ComparedKey(-1), lambda engine, key: engine.find(key)
+
+    def delete():
+        return (keys.pop(rng.randrange(len(keys))),
+                lambda engine, key: engine.delete(unwrap(key)))
+
+    def delete_min():
+        return None, lambda engine, key: engine.delete_min()
+
+    def insert_many():
+        return ([spare.pop() for _ in range(5)],
+                lambda engine, batch: engine.insert_many(
+                    [wrap(key) for key in batch]))
+
+    def delete_many():
+        return ([keys.pop(rng.randrange(len(keys))) for _ in range(5)],
+                lambda engine, batch: engine.delete_many(
+                    [unwrap(key) for key in batch]))
+
+    operations = [('insert', insert), ('find-hit', find_hit),
+                  ('find-miss', find_miss), ('delete', delete),
+                  ('insert-many', insert_many)]
+    if heap or isinstance(plain, AvlTree):
+        operations.append(('delete-min', delete_min))
+    if not heap:
+        operations.append(('delete-many', delete_many))
+
+    for key in keys:
+        plain.insert(wrap(key))
+        counted.insert(wrap(key))
+    counted.enable_stats()
+    wrong = []
+    for _ in range(rounds):
+        for name, operation in operations:
+            argument, apply = operation()
+            calls = ComparedKey.calls
+            try:
+                apply(plain, argument)
+            except ValueError:
+                pass
+            made = ComparedKey.calls - calls
+            if name in ('insert-many', 'delete-many') and isinstance(plain, AvlTree):
+                made -= sort_calls(argument)
+            counted.reset_stats()
+            try:
+                apply(counted, argument)
+            except ValueError:
+                pass
+            if counted.stats()['comparisons'] != made:
+                wrong.append((name, counted.stats()['comparisons'], made))
+    return wrong
+
+
+if __name__ == '__main__':
+    from bin_heap import DaryMinHeap
+
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    parser.add_argument('--size', type=int, default=500)
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    failed = False
+    for engine in (BinaryTree, AvlTree, BinaryMinHeap, DaryMinHeap):
+        wrong = check(lambda: engine("Check"), args.size)
+        for name, counted, made in wrong:
+            log.error("{} {}: counted {} comparisons, made {}".format(
+                engine.__name__, name, counted, made))
+        if not wrong:
+            log.info("{}: the counted comparisons match".format(
+                engine.__name__))
+        failed = failed or bool(wrong)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,201 @@
+import logging
+import math
+import random
+import sys
+import time
+from argparse import ArgumentParser
+from array import array
+
+from snapshot import HEADER, LENGTH, VERSION
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger()
+
+# Binary key files use the snapshot layout with a single section, so they can
+# be streamed back by ingest.py and read with read_snapshot
+KEYS_MAGIC = b'KEYS'
+
+# Keys generated and written at a time
+CHUNK = 1 << 18
+
+# The key range CreateDataFile has always used
+LOW = 1000000000
+HIGH = 9999999999
+
+DISTRIBUTIONS = ('uniform', 'sorted', 'reverse', 'zipf', 'duplicates')
+
+
+# Draws the keys of one distribution chunk by chunk. With numpy every chunk is
+# one vectorized draw, without it the keys come from random.Random. The same
+# seed gives the same keys on every run, but the two generators give
+# different keys for it
+class KeyGenerator(object):
+    def __init__(self, distribution='uniform', seed=None, low=LOW, high=HIGH,
+                 skew=1.5, distinct=None):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError("Unknown distribution {}".format(distribution))
+        if high < low:
+            raise ValueError("Empty key range {} - {}".format(low, high))
+        if skew <= 1:
+            raise ValueError("The Zipf skew must be larger than 1")
+        self.distribution = distribution
+        self.low = low
+        self.high = high
+        self.skew = skew
+        self.distinct = distinct
+        if numpy is not None:
+            self.rng = numpy.random.default_rng(seed)
+        else:
+            self.rng = random.Random(seed)
+
+    # Yields count keys in chunks of at most chunk keys, as numpy int64 arrays
+    # or as lists
+    def chunks(self, count, chunk=CHUNK):
+        draw = getattr(self, '_' + self.distribution)
+        # Sorted keys are a running sum of random gaps, uniform in [0, gap),
+        # so no chunk needs to see the others. The sum of count gaps has mean
+        # count * gap / 2 and deviation gap * sqrt(count / 12). Its mean ends
+        # six deviations short of the end of the range, so the walk covers
+        # most of it without running into the end, where it would be clamped
+        # into a run of copies of the last key
+        spread = count / 2 + 6 * math.sqrt(count / 12)
+        self.gap = max(1, int((self.high - self.low) / max(spread, 1)))
+        self.last = self.low if self.distribution == 'sorted' else self.high
+        if self.distinct is None:
+            self.pool = max(1, count // 100)
+        else:
+            self.pool = self.distinct
+        done = 0
+        while done < count:
+            size = min(chunk, count - done)
+            yield draw(size)
+            done += size
+
+    def _uniform(self, size):
+        if numpy is not None:
+            return self.rng.integers(self.low, self.high, size, endpoint=True)
+        randint = self.rng.randint
+        return [randint(self.low, self.high) for _ in range(size)]
+
+    def _sorted(self, size):
+        if numpy is not None:
+            keys = self.last + numpy.cumsum(self.rng.integers(0, self.gap, size))
+            keys = numpy.minimum(keys, self.high)
+            self.last = int(keys[-1])
+            return keys
+        keys = []
+        last = self.last
+        randrange = self.rng.randrange
+        for _ in range(size):
+            last = min(last + randrange(self.gap), self.high)
+            keys.append(last)
+        self.last = last
+        return keys
+
+    def _reverse(self, size):
+        if numpy is not None:
+            keys = self.last - numpy.cumsum(self.rng.integers(0, self.gap, size))
+            keys = numpy.maximum(keys, self.low)
+            self.last = int(keys[-1])
+            return keys
+        keys = []
+        last = self.last
+        randrange = self.rng.randrange
+        for _ in range(size):
+            last = max(last - randrange(self.gap), self.low)
+            keys.append(last)
+        self.last = last
+        return keys
+
+    # Key low + r - 1 has Zipf rank r, so the smallest keys are by far the
+    # most frequent. Ranks past the range wrap around
+    def _zipf(self, size):
+        span = self.high - self.low + 1
+        if numpy is not None:
+            return self.low + (self.rng.zipf(self.skew, size) - 1) % span
+        # A Pareto draw rounded down is the continuous version of Zipf
+        pareto = self.rng.paretovariate
+        shape = self.skew - 1
+        return [self.low + (int(pareto(shape)) - 1) % span for _ in range(size)]
+
+    # Keys drawn from a small pool of distinct values spread over the range,
+    # by default one distinct key per hundred keys
+    def _duplicates(self, size):
+        step = max(1, (self.high - self.low) // self.pool)
+        if numpy is not None:
+            return self.low + self.rng.integers(0, self.pool, size) * step
+        randrange = self.rng.randrange
+        return [self.low + randrange(self.pool) * step for _ in range(size)]
+
+
+def _write_csv(f, keys):
+    if numpy is not None:
+        keys = keys.tolist()
+    f.write('\n'.join(map(str, keys)).encode())
+    f.write(b'\n')
+
+
+def _write_binary(f, keys):
+    if numpy is not None:
+        keys.astype('<i8').tofile(f)
+        return
+    keys = array('q', keys)
+    if sys.byteorder == 'big':
+        keys.byteswap()
+    keys.tofile(f)
+
+
+# Writes count keys to path, one per line for csv, or as a binary key file.
+# The format defaults to binary for .bin files and csv otherwise
+def write_keys(path, count, distribution='uniform', seed=None, format=None,
+               chunk=CHUNK, **kwargs):
+    if format is None:
+        format = 'binary' if path.endswith('.bin') else 'csv'
+    if format not in ('csv', 'binary'):
+        raise ValueError("Unknown format {}".format(format))
+    generator = KeyGenerator(distribution, seed, **kwargs)
+    t1 = time.perf_counter()
+    with open(path, 'wb') as f:
+        if format == 'binary':
+            f.write(HEADER.pack(KEYS_MAGIC, VERSION, 1))
+            f.write(LENGTH.pack(count))
+            write = _write_binary
+        else:
+            write = _write_csv
+        for keys in generator.chunks(count, chunk):
+            write(f, keys)
+    log.info("Wrote {} {} keys to {} in {:.3f} seconds".format(
+        count, distribution, path, time.perf_counter() - t1))
+    return count
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    parser.add_argument('path')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                        default='uniform')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--format', choices=('csv', 'binary'))
+    parser.add_argument('--low', type=int, default=LOW)
+    parser.add_argument('--high', type=int, default=HIGH)
+    parser.add_argument('--skew', type=float, default=1.5)
+    parser.add_argument('--distinct', type=int)
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    write_keys(args.path, args.count, args.distribution, args.seed, args.format,
+               low=args.low, high=args.high, skew=args.skew,
+               distinct=args.distinct)
@@ -0,0 +1,26 @@
+from functools import partial
+from avl_tree import AvlTree
+from avl_pool import PooledAvlTree
+from bin_heap import BinaryMinHeap, DaryMinHeap, LinkedBinaryMinHeap
+from pairing_heap import PairingHeap
+
+# Every tree engine by the type name the GUI and the benchmarks create it with
+ENGINES = {
+    "avltree": AvlTree,
+    "pooledavl": PooledAvlTree,
+    "heap": BinaryMinHeap,
+    "linkedheap": LinkedBinaryMinHeap,
+    "dary4heap": partial(DaryMinHeap, d=4),
+    "dary8heap": partial(DaryMinHeap, d=8),
+    "pairingheap": PairingHeap,
+}
+
+# Engines that order all their keys, the others only know their minimum
+SEARCH_TREES = (AvlTree, PooledAvlTree)
+
+
+def create_engine(type, name):
+    try:
+        return ENGINES[type](name)
+    except KeyError:
+        raise ValueError("Unknown tree type {}".format(type))
@@ -0,0 +1,199 @@
+import logging
+import os
+from argparse import ArgumentParser
+from array import array
+import random
+
+from snapshot import map_snapshot, read_snapshot, write_snapshot
+
+log = logging.getLogger()
+
+FROZEN_MAGIC = b'EYTZ'
+
+
+# Lay the sorted keys out in BFS order (Eytzinger layout): the root is at 0
+# and the children of slot k are at 2k + 1 and 2k + 2. Filling the slots in
+# in-order order from the sorted keys gives a complete binary search tree
+def _eytzinger(keys):
+    n = len(keys)
+    slots = array('q', bytes(8 * n))
+    stack = []
+    slot = 0
+    i = 0
+    while stack or slot < n:
+        while slot < n:
+            stack.append(slot)
+            slot = 2 * slot + 1
+        slot = stack.pop()
+        slots[slot] = keys[i]
+        i += 1
+        slot = 2 * slot + 2
+    return slots
+
+
+# Immutable search index over the keys of a tree. The keys sit in one flat
+# int64 array in Eytzinger order, so a lookup walks down a single array: the
+# top levels share a few cache lines, there is no node object to follow and
+# nothing is allocated. The array can be saved to a file and opened with mmap,
+# then every process that opens the same file reads one copy in the page cache
+class FrozenAvlIndex:
+    def __init__(self, name, slots, mapped=None):
+        self.name = name
+        self.slots = slots
+        self.size = len(slots)
+        self.mapped = mapped
+
+    @classmethod
+    def from_sorted(cls, name, keys):
+        return cls(name, _eytzinger(keys))
+
+    def length(self):
+        return self.size
+
+    def __len__(self):
+        return self.size
+
+    def height(self):
+        return self.size.bit_length()
+
+    # Slot of the smallest key that is not smaller than value, or larger than
+    # it if inclusive, -1 if there is none
+    def _lower_bound(self, value, inclusive=False):
+        slots, n = self.slots, self.size
+        found = -1
+        slot = 0
+        while slot < n:
+            key = slots[slot]
+            if key < value or (inclusive and key == value):
+                slot = 2 * slot + 2
+            else:
+                found = slot
+                slot = 2 * slot + 1
+        return found
+
+    # Position of slot in the sorted keys. In a perfect tree it follows from
+    # the level and the place in the level, the complete tree only lacks the
+    # tail of the last level, so the missing leaves left of slot are dropped
+    def _in_order(self, slot):
+        levels = self.size.bit_length()
+        last_level = self.size - (1 << (levels - 1)) + 1
+        depth = (slot + 1).bit_length() - 1
+        offset = slot + 1 - (1 << depth)
+        if depth == levels - 1:
+            return 2 * offset
+        leaves = (2 * offset + 1) << (levels - 2 - depth)
+        missing = leaves - last_level if leaves > last_level else 0
+        return 2 * leaves - 1 - missing
+
+    def _successor(self, slot):
+        n = self.size
+        child = 2 * slot + 2
+        if child < n:
+            slot = child
+            while 2 * slot + 1 < n:
+                slot = 2 * slot + 1
+            return slot
+        # Climb while slot is a right child, the first left child reached has
+        # its parent as the successor
+        while slot and slot % 2 == 0:
+            slot = (slot - 1) // 2
+        return (slot - 1) // 2 if slot else -1
+
+    def __contains__(self, value):
+        slot = self._lower_bound(value)
+        return slot >= 0 and self.slots[slot] == value
+
+    # Returns the key, there are no nodes to hand out
+    def find(self, value):
+        slot = self._lower_bound(value)
+        if slot < 0 or self.slots[slot] != value:
+            raise ValueError
+        return self.slots[slot]
+
+    # Number of keys smaller than value, or not larger than it if inclusive
+    def _count_below(self, value, inclusive=False):
+        slot = self._lower_bound(value, inclusive)
+        return self._in_order(slot) if slot >= 0 else self.size
+
+    # Number of keys smaller than value, as AvlTree.rank
+    def rank(self, value):
+        return self._count_below(value)
+
+    # The keys between lo and hi, both included, in ascending order
+    def range(self, lo, hi):
+        slots = self.slots
+        slot = self._lower_bound(lo)
+        while slot >= 0 and not hi < slots[slot]:
+            yield slots[slot]
+            slot = self._successor(slot)
+
+    def count_range(self, lo, hi):
+        if hi < lo:
+            return 0
+        return self._count_below(hi, inclusive=True) - self._count_below(lo)
+
+    def __iter__(self):
+        if not self.size:
+            return iter(())
+        slot = 0
+        while 2 * slot + 1 < self.size:
+            slot = 2 * slot + 1
+        return self._walk(slot)
+
+    def _walk(self, slot):
+        slots = self.slots
+        while slot >= 0:
+            yield slots[slot]
+            slot = self._successor(slot)
+
+    # The slots are written as they are, so open() can map them in directly
+    def save(self, path):
+        write_snapshot(path, FROZEN_MAGIC, [(self.slots, self.size)])
+
+    # Map a saved index read-only, the keys are not copied
+    @classmethod
+    def open(cls, path, name=None):
+        mapped, (slots,) = map_snapshot(path, FROZEN_MAGIC)
+        return cls(name or os.path.basename(path), slots, mapped)
+
+    # Read a saved index into memory, for machines that can't map it
+    @classmethod
+    def load(cls, path, name=None):
+        (slots,) = read_snapshot(path, FROZEN_MAGIC)
+        return cls(name or os.path.basename(path), slots)
+
+    def close(self):
+        if self.mapped is not None:
+            self.slots.release()
+            self.mapped.close()
+            self.mapped = None
+            self.slots = array('q')
+            self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    parser.add_argument('path', nargs='?', default='frozen.idx')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    keys = sorted(random.randint(-100, 100) for _ in range(20))
+    FrozenAvlIndex.from_sorted("Test", keys).save(args.path)
+    with FrozenAvlIndex.open(args.path) as index:
+        print("Keys:", list(index))
+        print("Rank of 0:", index.rank(0))
+        print("Between -50 and 50:", list(index.range(-50, 50)))
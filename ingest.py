@@ -0,0 +1,173 @@
+import logging
+import sys
+import time
+from argparse import ArgumentParser
+from array import array
+
+from datagen import KEYS_MAGIC
+from snapshot import HEADER, LENGTH, check_header
+
+log = logging.getLogger()
+
+# Bytes read from the file at a time. A chunk becomes one batch of keys, so
+# this bounds the memory taken by the file independently of its size. Only
+# the bulk build of an empty AvlTree holds on to the keys, as sorted int64
+# runs of 8 bytes per key, until the tree is built from them
+CHUNK_BYTES = 1 << 20
+
+# Bytes that separate keys in text files: the comma and every byte that
+# bytes.split() splits on
+SEPARATORS = b', \t\n\r\x0b\x0c'
+
+
+# Counters for one pass over a file
+class IngestReport(object):
+    def __init__(self, path):
+        self.path = path
+        self.keys = 0
+        self.rejected = 0
+        self.bytes = 0
+        self.batches = 0
+        self.seconds = 0.0
+        # Only set by delete_file
+        self.deleted = 0
+        self.missing = 0
+
+    def throughput(self):
+        return self.keys / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return "{} keys ({} rejected) from {} in {:.3f} seconds, {:.0f} keys/s".format(
+            self.keys, self.rejected, self.path, self.seconds, self.throughput())
+
+
+# Keys are separated by commas and any whitespace, so one key per line, one
+# row of keys and any mix of both all read the same. The whole chunk goes
+# through int() in one map, only a chunk with a bad token is parsed key by key
+def _parse(data, report):
+    tokens = data.replace(b',', b' ').split()
+    try:
+        return list(map(int, tokens))
+    except ValueError:
+        pass
+    keys = []
+    for token in tokens:
+        try:
+            keys.append(int(token))
+        except ValueError:
+            report.rejected += 1
+            log.error("Found invalid key {} in {}, skipping it".format(
+                token.decode(errors='replace'), report.path))
+    return keys
+
+
+# Binary key files written by datagen.py are read straight into int64 arrays,
+# chunk_bytes at a time
+def _read_binary(f, report, chunk_bytes):
+    count = check_header(report.path, KEYS_MAGIC, f.read(HEADER.size))
+    report.bytes += HEADER.size
+    for _ in range(count):
+        (length,) = LENGTH.unpack(f.read(LENGTH.size))
+        report.bytes += LENGTH.size
+        while length:
+            keys = array('q')
+            try:
+                keys.fromfile(f, min(length, max(1, chunk_bytes // 8)))
+            except EOFError:
+                raise ValueError("Key file {} is truncated".format(report.path))
+            if sys.byteorder == 'big':
+                keys.byteswap()
+            length -= len(keys)
+            report.bytes += 8 * len(keys)
+            yield keys.tolist()
+
+
+# Keys as text: a chunk is cut after its last separator and the rest is
+# carried over to the next one, so no key is split between two batches
+def _read_text(f, report, chunk_bytes):
+    rest = b''
+    while True:
+        chunk = f.read(chunk_bytes)
+        if not chunk:
+            break
+        report.bytes += len(chunk)
+        data = rest + chunk
+        cut = max(data.rfind(separator) for separator in SEPARATORS)
+        if cut < 0:
+            rest = data
+            continue
+        rest = data[cut + 1:]
+        yield _parse(data[:cut], report)
+    yield _parse(rest, report)
+
+
+# Yields the keys of the file in batches of about one chunk each. Files that
+# start with the datagen.py magic are binary key files, all others are text
+def read_batches(path, report=None, chunk_bytes=CHUNK_BYTES):
+    if report is None:
+        report = IngestReport(path)
+    with open(path, 'rb') as f:
+        binary = f.read(len(KEYS_MAGIC)) == KEYS_MAGIC
+        f.seek(0)
+        read = _read_binary if binary else _read_text
+        for keys in read(f, report, chunk_bytes):
+            if keys:
+                report.keys += len(keys)
+                report.batches += 1
+                yield keys
+
+
+def _timed(report, apply):
+    t1 = time.perf_counter()
+    apply()
+    report.seconds = time.perf_counter() - t1
+    log.info(str(report))
+    return report
+
+
+# Insert every key of the file into tree. The chunks go to insert_batches,
+# which takes them one at a time, except that an empty engine is bulk built
+# from all of them at once
+def insert_file(tree, path, chunk_bytes=CHUNK_BYTES):
+    report = IngestReport(path)
+
+    def apply():
+        tree.insert_batches(read_batches(path, report, chunk_bytes))
+    return _timed(report, apply)
+
+
+# Delete one occurrence of every key of the file from tree, one delete_many
+# per chunk. The report also counts the keys that were not in the tree
+def delete_file(tree, path, chunk_bytes=CHUNK_BYTES):
+    report = IngestReport(path)
+
+    def apply():
+        for keys in read_batches(path, report, chunk_bytes):
+            deleted, missing = tree.delete_many(keys)
+            report.deleted += deleted
+            report.missing += missing
+    return _timed(report, apply)
+
+
+if __name__ == '__main__':
+    from engines import ENGINES, create_engine
+
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    parser.add_argument('--engine', choices=sorted(ENGINES.keys()),
+                        default='avltree')
+    parser.add_argument('--chunk-bytes', type=int, default=CHUNK_BYTES)
+    parser.add_argument('path')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    tree = create_engine(args.engine, "Ingest")
+    print(insert_file(tree, args.path, args.chunk_bytes))
+    print("The tree holds {} keys, height {}".format(tree.length(), tree.height()))
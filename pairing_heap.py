@@ -0,0 +1,167 @@
+from binary_tree import BinaryTree, TreeNode
+import logging
+import tracing
+from argparse import ArgumentParser
+import random
+log = logging.getLogger()
+
+
+# Min pairing heap, a heap ordered multiway tree stored in the usual binary
+# form: left points to the first child, right to the next sibling, and parent
+# to the previous sibling (or to the parent for a first child). Two heaps are
+# melded by making the larger root the first child of the smaller one, which
+# is O(1), and delete_min pairs up the children of the root, O(log n) amortized
+class PairingHeap(BinaryTree):
+    # delete-min is amortized, and find has to walk the heap
+    complexity = {'insert': '1', 'find-hit': 'n', 'find-miss': 'n',
+                  'delete': 'n', 'delete-min': 'log n',
+                  'bulk-load': '1', 'height': 'n'}
+
+    def __init__(self, name):
+        BinaryTree.__init__(self, name)
+
+    # Make the root with the larger key the first child of the other one,
+    # both arguments must be roots without siblings
+    def _link(self, first, second):
+        if second.value < first.value:
+            first, second = second, first
+        second.right = first.left
+        if first.left:
+            first.left.parent = second
+        second.parent = first
+        first.left = second
+        return first
+
+    # Combine a list of siblings into one tree, with the standard two passes:
+    # link them pairwise left to right, then fold the pairs right to left
+    def _merge_pairs(self, first):
+        pairs = []
+        while first:
+            second = first.right
+            first.parent = first.right = None
+            if not second:
+                pairs.append(first)
+                break
+            following = second.right
+            second.parent = second.right = None
+            pairs.append(self._link(first, second))
+            first = following
+
+        if not pairs:
+            return None
+        root = pairs.pop()
+        while pairs:
+            root = self._link(pairs.pop(), root)
+        return root
+
+    def insert(self, value):
+        if tracing.enabled:
+            log.debug("Inserting value {} into Pairing Heap {}".format(
+                value, self.name))
+        if type(value) == int:
+            value = TreeNode(value)
+        self.root = self._link(self.root, value) if self.root else value
+        self.size += 1
+        self.key_snapshot = None
+
+    # Move every key of other into this heap in O(1), other is left empty
+    def meld(self, other):
+        if tracing.enabled:
+            log.debug("Melding Pairing Heap {} into {}".format(
+                other.name, self.name))
+        if not isinstance(other, PairingHeap):
+            raise ValueError("Only pairing heaps can be melded")
+        if other is self or not other.root:
+            return
+        self.root = self._link(self.root, other.root) if self.root else other.root
+        self.size += other.size
+        self.key_snapshot = None
+        other.root = None
+        other.size = 0
+        other.key_snapshot = None
+
+    # There is no order between siblings, so this is a full walk
+    def find(self, node):
+        if tracing.enabled:
+            log.debug("Finding value {} in Pairing Heap {}".format(
+                node, self.name))
+        if isinstance(node, TreeNode):
+            node = node.value
+        stack = [self.root] if self.root else []
+        while stack:
+            cur = stack.pop()
+            if cur.value == node:
+                return cur
+            # Children are not smaller than their parent, skip the subtree
+            if cur.left and not node < cur.value:
+                stack.append(cur.left)
+            if cur.right:
+                stack.append(cur.right)
+        raise ValueError
+
+    def _find_min(self):
+        if tracing.enabled:
+            log.debug("Finding min element in heap {}".format(self.name))
+        return self.root
+
+    def delete(self, node):
+        if tracing.enabled:
+            log.debug("Deleting node {} in Pairing Heap {}".format(
+                node, self.name))
+        found = self.find(node)
+        if found is self.root:
+            self.root = self._merge_pairs(found.left)
+        else:
+            # Cut the subtree out of its sibling list and put its children
+            # back into the heap
+            if found.parent.left is found:
+                found.parent.left = found.right
+            else:
+                found.parent.right = found.right
+            if found.right:
+                found.right.parent = found.parent
+            children = self._merge_pairs(found.left)
+            if children:
+                self.root = self._link(self.root, children)
+        found.left = found.right = found.parent = None
+        self.size -= 1
+        self.key_snapshot = None
+
+    def delete_min(self):
+        if tracing.enabled:
+            log.debug("ExtractMin for heap {}".format(self.name))
+        if not self.root:
+            raise ValueError
+        node = self.root
+        self.root = self._merge_pairs(node.left)
+        node.left = None
+        self.size -= 1
+        self.key_snapshot = None
+        return node
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+    tracing.set_trace(numLogLevel <= logging.DEBUG)
+
+    heap = PairingHeap("Test")
+    other = PairingHeap("Other")
+    for _ in range(5):
+        heap.insert(random.randint(-100, 100))
+        other.insert(random.randint(-100, 100))
+    heap.meld(other)
+    print(heap)
+
+    for i in range(4):
+        print("Min:", heap.delete_min())
+        print("Tree:\n", heap)
@@ -0,0 +1,120 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+# Binary snapshot of an engine: a header with a 4 byte magic that names the
+# engine, the format version and the number of sections, then every section as
+# its length followed by that many keys. Everything is little endian and 64
+# bit, so the sections start 8 byte aligned and can be mapped in directly
+HEADER = struct.Struct('<4sIQ')
+LENGTH = struct.Struct('<Q')
+VERSION = 1
+
+# Keys are written in chunks, so saving a tree never copies all of it
+CHUNK = 1 << 16
+
+
+def _write_keys(f, keys, count):
+    f.write(LENGTH.pack(count))
+    chunk = array('q')
+    written = 0
+    for key in keys:
+        try:
+            chunk.append(key)
+        except OverflowError:
+            raise ValueError("Key {} does not fit in 64 bits".format(key))
+        if len(chunk) == CHUNK:
+            written += _write_chunk(f, chunk)
+            chunk = array('q')
+    written += _write_chunk(f, chunk)
+    if written != count:
+        raise ValueError("Expected {} keys, got {}".format(count, written))
+
+
+def _write_chunk(f, chunk):
+    if sys.byteorder == 'big':
+        chunk.byteswap()
+    chunk.tofile(f)
+    return len(chunk)
+
+
+# sections is a list of (keys, count) pairs, keys can be any iterable of ints.
+# The snapshot is written to a temporary file next to path and only replaces
+# path once it is complete, so a save that fails, for example on a key that
+# doesn't fit in 64 bits, leaves the previous snapshot as it was
+def write_snapshot(path, magic, sections):
+    temp = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temp, 'xb') as f:
+            f.write(HEADER.pack(magic, VERSION, len(sections)))
+            for keys, count in sections:
+                _write_keys(f, keys, count)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+
+# Validates the header of a snapshot and returns its number of sections
+def check_header(path, magic, header):
+    found, version, count = HEADER.unpack(header)
+    if found != magic:
+        raise ValueError("{} is not a {} snapshot".format(
+            path, magic.decode()))
+    if version != VERSION:
+        raise ValueError("Unsupported snapshot version {}".format(version))
+    return count
+
+
+# Returns the sections of the snapshot as arrays of int64
+def read_snapshot(path, magic):
+    with open(path, 'rb') as f:
+        count = check_header(path, magic, f.read(HEADER.size))
+
+        sections = []
+        for _ in range(count):
+            (length,) = LENGTH.unpack(f.read(LENGTH.size))
+            keys = array('q')
+            try:
+                keys.fromfile(f, length)
+            except EOFError:
+                raise ValueError("Snapshot {} is truncated".format(path))
+            if sys.byteorder == 'big':
+                keys.byteswap()
+            sections.append(keys)
+        return sections
+
+
+# Maps the snapshot read-only instead of reading it, the sections are int64
+# memoryviews straight into the page cache, so every process that maps the
+# same file shares one copy. Returns the mmap, which must stay open while the
+# sections are used, and the sections
+def map_snapshot(path, magic):
+    if sys.byteorder != 'little':
+        raise ValueError("Snapshots can only be mapped on little endian machines")
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    sections = []
+    try:
+        count = check_header(path, magic, mapped[:HEADER.size])
+        offset = HEADER.size
+        for _ in range(count):
+            (length,) = LENGTH.unpack_from(mapped, offset)
+            offset += LENGTH.size
+            if offset + 8 * length > len(mapped):
+                raise ValueError("Snapshot {} is truncated".format(path))
+            sections.append(memoryview(mapped)[offset:offset + 8 * length].cast('q'))
+            offset += 8 * length
+    except Exception:
+        for section in sections:
+            section.release()
+        mapped.close()
+        raise
+    return mapped, sections
@@ -1,112 +1,416 @@
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import sys
 import time
-from random import randint
-from timeit import timeit
-import numpy
-import matplotlib.pyplot as plt
-
-from avl_tree import AvlTree
-from bin_heap import BinaryMinHeap
-
-
-def get_x_y(measure):
-    x = []
-    y = []
-    for elem in measure:
-        if len(elem) > 0:
-            x.append(elem[0])
-            y.append(elem[1])
-    return (x, y)
-
-
-def plot(measure_tree, measure_heap, title, xlabel, ylabel):
-    (x, y) = get_x_y(measure_tree)
-    (u, v) = get_x_y(measure_heap)
-    axes = plt.gca()
-    axes.set_ylim([0, max(y[:] + v[:])])
-    plt.scatter(x, y, c='red', label="AVL Tree")
-    plt.scatter(u, v, c='blue', label="Binary Heap")
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel(ylabel)
-    plt.legend(loc='best')
-    plt.show()
-
-
-avl = AvlTree("Tree")
-heap = BinaryMinHeap("Heap")
-
-measure_insert_tree = []
-measure_insert_heap = []
-measure_find_tree = []
-measure_find_heap = []
-measure_deletemin_tree = []
-measure_deletemin_heap = []
-
-num_trials = 10000
-# Insert Tree
-for i in range(1, num_trials):
-    t1 = time.perf_counter()
-    avl.insert(randint(1000000000, 9999999999))
-    t2 = time.perf_counter()
-    measure_insert_tree.append([i, t2-t1])
-
-# Insert Heap
-for i in range(1, num_trials):
-    t1 = time.perf_counter()
-    heap.insert(randint(1000000000, 9999999999))
-    t2 = time.perf_counter()
-    measure_insert_heap.append([i, t2-t1])
-
-plot(measure_insert_tree, measure_insert_heap, 'Insert Time Comparision',
-     'Number of Elements in Tree', 'Time (seconds)')
-"""
-# Find Tree
-avl2 = AvlTree("FindTree")
-for i in range(1, int(num_trials/100)):
-    for _ in range(1, 100):
-        avl2.insert(randint(1000000000, 9999999999))
-    t1 = time.perf_counter()
-    try:
-        avl2.find(randint(1000000000, 9999999999))
-    except ValueError:
-        pass
-    t2 = time.perf_counter()
-    measure_find_tree.append([i*100, t2-t1])
-del avl2
-
-# Find Heap
-heap2 = BinaryMinHeap("FindHeap")
-for i in range(1, int(num_trials/100)):
-    for _ in range(1, 100):
-        heap2.insert(randint(1000000000, 9999999999))
-    t1 = time.perf_counter()
+from argparse import ArgumentParser
+
+from datagen import DISTRIBUTIONS, KeyGenerator
+from engines import ENGINES, create_engine
+
+log = logging.getLogger()
+
+# Named baselines saved with --save-baseline and read by --compare
+BASELINE_DIR = 'baselines'
+
+# Benchmark runner for the engines. For every engine, key distribution and
+# size, an engine is filled with that many keys and a number of single
+# operations are timed one by one, so every result has latency percentiles
+# next to its throughput. The results are written as JSON, plots are optional
+# and written to files. Example:
+#   python tests.py --engines avltree heap --sizes 1000 100000 --output run.json
+# For CI, save a baseline once and compare later runs against it, the run
+# exits with 1 when an operation got slower by more than the margin:
+#   python tests.py --repeats 5 --save-baseline main
+#   python tests.py --repeats 5 --compare main --margin 0.1
+
+
+def generate_keys(distribution, count, seed):
+    keys = []
+    for chunk in KeyGenerator(distribution, seed).chunks(count):
+        keys.extend(chunk.tolist() if hasattr(chunk, 'tolist') else chunk)
+    return keys
+
+
+# Every operation takes an engine already holding keys, and returns the
+# latency of each timed call in nanoseconds. Operations an engine does not
+# have raise NotImplementedError
+def _time_calls(method, arguments):
+    clock = time.perf_counter_ns
+    latencies = []
+    for argument in arguments:
+        t1 = clock()
+        method(argument)
+        latencies.append(clock() - t1)
+    return latencies
+
+
+def op_insert(engine, keys, probes):
+    return _time_calls(engine.insert, probes.extra)
+
+
+def op_find_hit(engine, keys, probes):
+    return _time_calls(engine.find, probes.hits)
+
+
+def op_find_miss(engine, keys, probes):
+    find = engine.find
+    clock = time.perf_counter_ns
+    latencies = []
+    for key in probes.misses:
+        t1 = clock()
+        try:
+            find(key)
+        except ValueError:
+            pass
+        latencies.append(clock() - t1)
+    return latencies
+
+
+def op_delete(engine, keys, probes):
+    return _time_calls(engine.delete, probes.hits)
+
+
+def op_delete_min(engine, keys, probes):
+    if not hasattr(engine, 'delete_min'):
+        raise NotImplementedError
+    delete_min = engine.delete_min
+    clock = time.perf_counter_ns
+    latencies = []
+    for _ in range(min(len(probes.hits), engine.length())):
+        t1 = clock()
+        delete_min()
+        latencies.append(clock() - t1)
+    return latencies
+
+
+# One build of the whole engine from the keys per sample, reported per key
+def op_bulk_load(engine, keys, probes):
+    latencies = []
+    for sample in range(probes.builds):
+        fresh = create_engine(probes.engine, "Bulk")
+        t1 = time.perf_counter_ns()
+        fresh.insert_many(keys)
+        latencies.append((time.perf_counter_ns() - t1) / len(keys))
+        del fresh
+    return latencies
+
+
+def op_height(engine, keys, probes):
+    height = engine.height
+    clock = time.perf_counter_ns
+    latencies = []
+    for _ in range(probes.calls):
+        t1 = clock()
+        height()
+        latencies.append(clock() - t1)
+    return latencies
+
+
+OPERATIONS = {
+    'insert': op_insert,
+    'find-hit': op_find_hit,
+    'find-miss': op_find_miss,
+    'delete': op_delete,
+    'delete-min': op_delete_min,
+    'bulk-load': op_bulk_load,
+    'height': op_height,
+}
+
+
+# The keys the operations work on, drawn once per engine fill so every
+# engine sees the same ones
+class Probes(object):
+    def __init__(self, engine, keys, distribution, samples, builds, seed):
+        rng = random.Random(seed)
+        present = set(keys)
+        self.engine = engine
+        self.hits = rng.sample(keys, min(samples, len(keys)))
+        self.extra = generate_keys(distribution, samples, seed + 1)
+        self.misses = []
+        for key in generate_keys('uniform', 4 * samples, seed + 2):
+            if key not in present:
+                self.misses.append(key)
+                if len(self.misses) == samples:
+                    break
+        self.builds = builds
+        # height() can be a full walk, so it is called fewer times
+        self.calls = max(1, samples // 10)
+
+
+# Nearest rank percentile of sorted values
+def percentile(values, q):
+    if not values:
+        return 0
+    rank = max(0, min(len(values) - 1, int(round(q / 100.0 * len(values))) - 1))
+    return values[rank]
+
+
+# Two sided 95% quantiles of Student's t distribution by degrees of freedom,
+# larger samples use the normal quantile
+T95 = [(1, 12.706), (2, 4.303), (3, 3.182), (4, 2.776), (5, 2.571),
+       (6, 2.447), (7, 2.365), (8, 2.306), (9, 2.262), (10, 2.228),
+       (15, 2.131), (20, 2.086), (30, 2.042)]
+
+
+def t95(df):
+    quantile = 1.96
+    for degrees, value in reversed(T95):
+        if df >= degrees:
+            return value if df <= 30 else quantile
+    return quantile
+
+
+# Mean of values with the bounds of its 95% confidence interval
+def confidence_interval(values):
+    mean = sum(values) / len(values)
+    if len(values) < 2:
+        return mean, mean, mean
+    variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+    half = t95(len(values) - 1) * (variance / len(values)) ** 0.5
+    return mean, mean - half, mean + half
+
+
+# Percentiles over the samples of all repeats, and the confidence interval of
+# the median across repeats, which is what runs are compared on
+def summarize(repeats):
+    latencies = sorted(l for latencies in repeats for l in latencies)
+    total = sum(latencies)
+    medians = [percentile(sorted(latencies), 50) for latencies in repeats]
+    mean, low, high = confidence_interval(medians)
+    return {
+        'samples': len(latencies),
+        'p50_ns': percentile(latencies, 50),
+        'p99_ns': percentile(latencies, 99),
+        'mean_ns': total / len(latencies) if latencies else 0,
+        'ops_per_sec': len(latencies) * 1e9 / total if total else 0,
+        'repeat_p50_ns': medians,
+        'ci_low_ns': low,
+        'ci_high_ns': high,
+    }
+
+
+def measure(engine, operation, size, distribution, samples=1000, builds=3,
+            seed=0):
+    keys = generate_keys(distribution, size, seed)
+    probes = Probes(engine, keys, distribution, samples, builds, seed)
+    tree = create_engine(engine, "Benchmark")
+    if operation != 'bulk-load':
+        tree.insert_many(keys)
+    # Collections in the middle of a timed call land in the tail latencies
+    collecting = gc.isenabled()
+    gc.collect()
+    gc.disable()
     try:
-        heap2.find(randint(1000000000, 9999999999))
-    except ValueError:
-        pass
-    t2 = time.perf_counter()
-    measure_find_heap.append([i*100, t2-t1])
-del heap2
-
-plot(measure_find_tree, measure_find_heap, 'Find Time Comparision',
-     'Number of Elements in Tree', 'Time (seconds)')
-"""
-# Delete Min Tree
-for i in range(1, num_trials):
-    t1 = time.perf_counter()
-    node = avl._find_min(avl.root)
-    avl.delete(node)
-    t2 = time.perf_counter()
-    measure_deletemin_tree.append([avl.length(), t2-t1])
-
-# Delete Min Heap
-for i in range(1, num_trials):
-    t1 = time.perf_counter()
-    heap.delete_min()
-    t2 = time.perf_counter()
-    measure_deletemin_heap.append([heap.length(), t2-t1])
-
-plot(measure_deletemin_tree, measure_deletemin_heap,
-     'DeleteMin Time Comparision', 'Number of Elements in Tree', 'Time (seconds)')
-del heap
-del avl
+        latencies = OPERATIONS[operation](tree, keys, probes)
+    finally:
+        if collecting:
+            gc.enable()
+    return latencies
+
+
+# The whole matrix is measured once per repeat, so slow drifts of the machine
+# spread over all results instead of hitting the last few
+def run(engines, operations, sizes, distributions, samples=1000, builds=3,
+        seed=0, repeats=1):
+    cases = [(engine, operation, size, distribution)
+             for distribution in distributions
+             for size in sizes
+             for engine in engines
+             for operation in operations]
+    measured = {}
+    for repeat in range(repeats):
+        for case in cases:
+            engine, operation, size, distribution = case
+            try:
+                latencies = measure(engine, operation, size, distribution,
+                                    samples, builds, seed)
+            except NotImplementedError:
+                if not repeat:
+                    log.info("{} has no {}, skipped".format(engine, operation))
+                continue
+            measured.setdefault(case, []).append(latencies)
+
+    results = []
+    for case in cases:
+        if case not in measured:
+            continue
+        engine, operation, size, distribution = case
+        result = {
+            'engine': engine,
+            'operation': operation,
+            'size': size,
+            'distribution': distribution,
+        }
+        result.update(summarize(measured[case]))
+        log.info("{engine:>12} {operation:>10} {size:>9} "
+                 "{distribution:>10} p50 {p50_ns:>8} ns "
+                 "p99 {p99_ns:>8} ns {ops_per_sec:>12.0f} ops/s".format(
+                     **result))
+        results.append(result)
+    return results
+
+
+def _case(result):
+    return (result['engine'], result['operation'], result['size'],
+            result['distribution'])
+
+
+# Compares the median of every case in results with the same case in the
+# baseline. A case regressed when it is slower by more than margin and its
+# confidence interval lies above the one of the baseline, so noise alone
+# doesn't fail a run. Returns the report rows and the number of regressions
+def compare(baseline, results, margin):
+    before = dict((_case(result), result) for result in baseline)
+    rows = []
+    regressions = 0
+    for result in results:
+        old = before.get(_case(result))
+        if old is None:
+            continue
+        old_p50 = sum(old['repeat_p50_ns']) / len(old['repeat_p50_ns'])
+        new_p50 = sum(result['repeat_p50_ns']) / len(result['repeat_p50_ns'])
+        change = new_p50 / old_p50 - 1 if old_p50 else 0.0
+        if change > margin and result['ci_low_ns'] > old['ci_high_ns']:
+            status = 'REGRESSION'
+            regressions += 1
+        elif change < -margin and result['ci_high_ns'] < old['ci_low_ns']:
+            status = 'faster'
+        elif abs(change) > margin:
+            status = 'noise'
+        else:
+            status = 'same'
+        rows.append(_case(result) + (old_p50, new_p50, change, status))
+    return rows, regressions
+
+
+def print_report(rows, name):
+    print("Compared with baseline {}".format(name))
+    print("{:>12} {:>10} {:>9} {:>10} {:>12} {:>12} {:>8}  {}".format(
+        "Engine", "Operation", "Size", "Keys", "Base (ns)", "New (ns)",
+        "Change", "Status"))
+    for engine, operation, size, distribution, old, new, change, status in rows:
+        print("{:>12} {:>10} {:>9} {:>10} {:>12.0f} {:>12.0f} {:>+7.1%}  {}".format(
+            engine, operation, size, distribution, old, new, change, status))
+
+
+def baseline_path(name):
+    return os.path.join(BASELINE_DIR, name + '.json')
+
+
+def load_baseline(name):
+    with open(baseline_path(name)) as f:
+        return json.load(f)['results']
+
+
+def environment(args):
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'samples': args.samples,
+        'builds': args.builds,
+        'seed': args.seed,
+        'repeats': args.repeats,
+    }
+
+
+# One PNG per operation and distribution, the p50 latency of every engine
+# against the size. matplotlib is only needed for this
+def plot(results, prefix):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    charts = {}
+    for result in results:
+        key = (result['operation'], result['distribution'])
+        series = charts.setdefault(key, {}).setdefault(result['engine'], [])
+        series.append((result['size'], result['p50_ns']))
+
+    files = []
+    for (operation, distribution), engines in sorted(charts.items()):
+        plt.figure()
+        for engine, points in sorted(engines.items()):
+            points.sort()
+            plt.plot([p[0] for p in points], [p[1] for p in points],
+                     marker='o', label=engine)
+        plt.xscale('log')
+        plt.title('{} ({} keys)'.format(operation, distribution))
+        plt.xlabel('Number of keys')
+        plt.ylabel('p50 latency (ns)')
+        plt.legend(loc='best')
+        path = '{}-{}-{}.png'.format(prefix, operation, distribution)
+        plt.savefig(path)
+        plt.close()
+        files.append(path)
+    return files
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--log')
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES.keys()),
+                        default=['avltree', 'heap'])
+    parser.add_argument('--operations', nargs='+',
+                        choices=sorted(OPERATIONS.keys()),
+                        default=sorted(OPERATIONS.keys()))
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--distributions', nargs='+', choices=DISTRIBUTIONS,
+                        default=['uniform'])
+    parser.add_argument('--samples', type=int, default=1000,
+                        help='operations timed per result')
+    parser.add_argument('--builds', type=int, default=3,
+                        help='builds timed per bulk-load result')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='runs of the whole matrix, for confidence intervals')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--plot', metavar='PREFIX',
+                        help='also write PREFIX-<operation>-<distribution>.png')
+    parser.add_argument('--save-baseline', metavar='NAME',
+                        help='also save the results as baseline NAME')
+    parser.add_argument('--compare', metavar='NAME',
+                        help='compare the results with baseline NAME')
+    parser.add_argument('--margin', type=float, default=0.1,
+                        help='slowdown tolerated by --compare, 0.1 is 10%%')
+    args = parser.parse_args()
+    logLevel = args.log
+
+    if logLevel == None:
+        logLevel = "INFO"
+
+    numLogLevel = getattr(logging, logLevel.upper())
+    logging.basicConfig(level=numLogLevel)
+    log.setLevel(numLogLevel)
+
+    results = run(args.engines, args.operations, args.sizes,
+                  args.distributions, args.samples, args.builds, args.seed,
+                  args.repeats)
+    report = {'environment': environment(args), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print("Wrote {} results to {}".format(len(results), args.output))
+    if args.save_baseline:
+        if not os.path.isdir(BASELINE_DIR):
+            os.makedirs(BASELINE_DIR)
+        with open(baseline_path(args.save_baseline), 'w') as f:
+            json.dump(report, f, indent=2)
+        print("Saved baseline", args.save_baseline)
+    if args.plot:
+        for path in plot(results, args.plot):
+            print("Wrote plot", path)
+    if args.compare:
+        rows, regressions = compare(load_baseline(args.compare), results,
+                                    args.margin)
+        print_report(rows, args.compare)
+        if regressions:
+            print("{} operations regressed by more than {:.0%}".format(
+                regressions, args.margin))
+            sys.exit(1)
@@ -0,0 +1,10 @@
+# Switch for the step by step debug logging of the tree engines. The hot paths
+# check it before building a message, so while it is off a trace point costs
+# one attribute lookup instead of formatting the nodes into a string that the
+# logger throws away. Turn it on together with DEBUG logging
+enabled = False
+
+
+def set_trace(on):
+    global enabled
+    enabled = bool(on)